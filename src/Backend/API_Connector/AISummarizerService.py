@@ -1,10 +1,13 @@
 from openai import OpenAI
+import openai
 import requests
 import os
 import fitz  # PyMuPDF
 from docx import Document
 import pathlib
 
+from Backend.API_Connector.serviceErrors import TransientServiceError, retry_after_seconds
+
 class AISummarizerService: 
     @staticmethod       
     def summarize_from_external_service(filename: pathlib.Path) -> str:
@@ -12,19 +15,21 @@ class AISummarizerService:
         Summarizes the content of a file downloaded from an external service.
         Args:
             filename (pathlib.Path): The path to the downloaded file.
+            
+        Raises:
+            ValueError: If the file can't be read.
+            TransientServiceError: If OpenAI was rate limited or unavailable, so it's worth retrying.
         """
 
         try:
             content = AISummarizerService.read_file_contents(filename)
-            if content:
-                print(f"Successfully read content from {filename}")
-                content = AISummarizerService.summarize_content(content)
+        finally:
             os.remove(filename)  # Cleanup the temp file after reading
-            return content
-        except Exception as e:
-            print(f"could not read downloaded file: {e}")
-
-        return AISummarizerService.summarize_content(content)
+        
+        if content:
+            print(f"Successfully read content from {filename}")
+            content = AISummarizerService.summarize_content(content)
+        return content
 
     @staticmethod
     def read_file_contents(filepath):
@@ -78,6 +83,11 @@ class AISummarizerService:
             )
             return response.choices[0].message.content
         
+        #raise rather than return the error, so it never ends up stored as the file's summary
+        except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+            response = getattr(e, 'response', None)
+            retry_after = retry_after_seconds(response.headers.get('Retry-After')) if response is not None else None
+            raise TransientServiceError(f"Error calling OpenAI API: {e}", retry_after) from e
         except Exception as e:
             print(f"\nFULL OpenAI ERROR:\n{e}\n")
-            return f"Error calling OpenAI API: {e}"
+            raise
@@ -1,85 +1,212 @@
 from Backend.API_Connector import requestors
 from Backend.API_Key_Container.AccountDB import APIKeyManager
-from Backend.FileDatabase.database import fileDatabase
+from Backend.FileDatabase.database import fileDatabase, JobInfo, JOB_FAILED
 from Backend.API_Connector.AISummarizerService import AISummarizerService
+from Backend.API_Connector.jobQueue import JobQueue
+from Backend.API_Connector.retryScheduler import RetryScheduler, backoff_delay
+from Backend.API_Connector.serviceErrors import TransientServiceError
 
 from urllib import parse
 import enum
 
-import heapq
-
 import threading
 
 import pathlib
+import tempfile
+import time
+import uuid
+
+#the most requests in flight at once per service, whatever the number of workers
+DEFAULT_SERVICE_LIMITS = {
+    'Google Drive': 4,
+    'OneDrive': 4,
+    'OpenAI': 2,
+}
+#the limit of a service missing from the table
+DEFAULT_SERVICE_LIMIT = 4
 
 class FileOrchestrator:
-    def __init__(self, api_key_manager: APIKeyManager, file_database: fileDatabase):
+    #job priorities: lower runs sooner
+    INTERACTIVE_PRIORITY = 0  # something the user is looking at right now
+    DEFAULT_PRIORITY = 1
+    
+    def __init__(self, api_key_manager: APIKeyManager, file_database: fileDatabase, workers: int = 8, service_limits: dict[str, int] = None, queue_size: int = 1000,
+                 download_workers: int = 4, extract_workers: int = 2, summarize_workers: int = 2, stage_queue_size: int = 16,
+                 max_attempts: int = 5, retry_base_delay: float = 2.0, retry_max_delay: float = 300.0):
         """
         Initializes the FileOrchestrator with an API key manager and a file database.
         
+        Files are added by one pool of worker threads. Their summaries then go through a pipeline of
+        three stages, each with its own pool: downloading, extracting the text (CPU-bound), and
+        asking OpenAI for the summary (rate limited). Bounded queues between the stages let every
+        stage work at once, and make a stage that runs ahead wait for the slower one after it,
+        without ever holding up the workers adding files.
+        A semaphore per service also keeps each one under its own limit.
+        
+        Every job is also recorded in the file database's jobs table, and the jobs left pending
+        (or interrupted) when the app last closed are queued again here.
+        
+        A job that hits a rate limit, a server error or a connection problem is retried after an
+        exponential backoff with jitter (never sooner than the service's Retry-After), up to
+        max_attempts times. Any other failure, or running out of attempts, leaves the job failed:
+        dead_letters lists those and replay_dead_letter runs one again.
+        
         Args:
             api_key_manager (APIKeyManager): An instance of the APIKeyManager class for managing API keys.
             file_database (fileDatabase): An instance of the fileDatabase class for managing files.
+            workers (int): How many files can be added at once.
+            service_limits (dict[str, int]): The most concurrent requests per service name, on top of DEFAULT_SERVICE_LIMITS.
+            queue_size (int): The most files waiting to be added; queue_add_file blocks while that many are, unless told not to.
+            download_workers (int): How many files can be downloaded for summarizing at once.
+            extract_workers (int): How many downloaded files can have their text extracted at once.
+            summarize_workers (int): How many texts can be summarized at once.
+            stage_queue_size (int): The most files waiting between two stages.
+            max_attempts (int): How many times a job is tried before it is left failed.
+            retry_base_delay (float): Seconds to wait before the first retry; the wait doubles with each one.
+            retry_max_delay (float): The longest wait between two attempts, in seconds.
         """
         self.api_key_manager = api_key_manager
         self.file_database = file_database
         
-        self.processing_thread_running = True
-        self.processingQueue = [] #this is a list of all the files that are being processed by the orchestrator
-        self.processing_wakeup = threading.Condition()
-        self.processing_thread = threading.Thread(target=self.process_files, daemon=True)
-        self.processing_thread.start()
-        
-    def process_files(self):
-        """
-        Processes files in the processing queue. This method runs in a separate thread.
-        """
-        while self.processing_thread_running:
-            with self.processing_wakeup:
-                print("processing thread going to sleep!")
-                while not self.processingQueue and self.processing_thread_running:
-                    self.processing_wakeup.wait()
-                
-                
-                while(self.processingQueue and self.processing_thread_running):
-                    try:
-                        file = heapq.heappop(self.processingQueue)
-                        if(file.function == self.FileObject.Functions.ADD_FILE):
-                            self.__add_file(file.URL, file.folderID, description=file.description)
-                        elif(file.function == self.FileObject.Functions.GET_SUMMARY):
-                            self.__summarize_external_file(URL=file.URL, fileID=file.fileID)
-                    except Exception as e:
-                        print(f"Error processing file: {e}")
-        
-    class FileObject:
-        def __init__(self, function: int, priority: int, URL: str = None, folderID: int = None, fileID: int = None, description: str = None):
-            """
-            Initializes a FileObject
+        limits = {**DEFAULT_SERVICE_LIMITS, **(service_limits or {})}
+        self.service_slots = {service: threading.BoundedSemaphore(limit) for service, limit in limits.items()}
+        
+        self.processingQueue = JobQueue(queue_size) #this is a list of all the files that are being processed by the orchestrator
+        #summary jobs waiting to be downloaded; unbounded, as they are already saved and queued by the add workers
+        self.downloadQueue = JobQueue()
+        #(job, downloaded file) and (job, text) pairs on their way through the pipeline, still in priority order
+        self.extractQueue = JobQueue(stage_queue_size)
+        self.summarizeQueue = JobQueue(stage_queue_size)
+        
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        #holds the jobs waiting out their backoff, then queues them again
+        self.retry_scheduler = RetryScheduler(self.__requeue)
+        
+        #pick up where the last run stopped, including the retries that were still waiting
+        now = time.time()
+        for job in self.file_database.resume_jobs():
+            if job.run_after and job.run_after > now:
+                self.retry_scheduler.schedule(job, job.run_after - now)
+            else:
+                self.__requeue(job)
+        
+        self.processing_threads = [threading.Thread(target=self.process_files, args=(self.processingQueue,), daemon=True) for _ in range(max(1, workers))]
+        self.processing_threads += [threading.Thread(target=self.process_files, args=(self.downloadQueue,), daemon=True)
+                                    for _ in range(max(1, download_workers))]
+        self.processing_threads += [threading.Thread(target=self.process_stage, args=(self.extractQueue, self.__extract_text), daemon=True)
+                                    for _ in range(max(1, extract_workers))]
+        self.processing_threads += [threading.Thread(target=self.process_stage, args=(self.summarizeQueue, self.__summarize_text), daemon=True)
+                                    for _ in range(max(1, summarize_workers))]
+        for thread in self.processing_threads:
+            thread.start()
+        
+    def process_files(self, job_queue: JobQueue):
+        """
+        Claims and runs the jobs of a queue: adding files, or downloading them to be summarized.
+        """
+        while True:
+            job = job_queue.get()
+            if job is None:
+                return
             
-            Args:
-                URL (str): The path to the file.
-                folderID (int): The ID of the folder to which the file belongs.
-                fileID (int): The ID of the file in the database.
-            """
-            self.URL = URL
-            self.folderID = folderID
-            self.fileID = fileID
-            self.function = function
-            self.priority = priority
-            self.description = description
+            try:
+                self.__run_job(job)
+            except Exception as e:
+                print(f"Error processing file: {e}")
+    
+    def __run_job(self, job: JobInfo):
+        #only the worker that claims the job runs it
+        job = self.file_database.claim_job(job.id)
+        if job is None:
+            return
         
-        #need to overload the less than comparator for the priority queue
-        def __lt__(self, other):
-            return self.priority < other.priority
+        try:
+            if(job.kind == self.Functions.ADD_FILE.value):
+                self.__add_file(job)
+            elif(job.kind == self.Functions.GET_SUMMARY.value):
+                self.__summarize_external_file(job)
+            else:
+                raise ValueError(f"Unknown job kind: {job.kind}")
+        except Exception as e:
+            self.__job_failed(job, e)
     
+    def __job_failed(self, job: JobInfo, error: Exception):
+        print(f"Error processing file: {error}")
+        #stopping closes the queues under running jobs; leave those running so the next start resumes them
+        if self.processingQueue.closed:
+            return
         
-        class Functions(enum.Enum):
-            ADD_FILE = 1
-            GET_SUMMARY = 2
+        try:
+            if isinstance(error, TransientServiceError) and job.attempts < self.max_attempts:
+                #worth another try once the service has had time to recover
+                delay = backoff_delay(job.attempts, self.retry_base_delay, self.retry_max_delay, error.retry_after)
+                job = self.file_database.retry_job(job.id, str(error), time.time() + delay)
+                if job:
+                    self.retry_scheduler.schedule(job, delay)
+            else:
+                self.file_database.fail_job(job.id, str(error))
+        except Exception as e:
+            print(f"Error recording failed job: {e}")
+    
+    def __requeue(self, job: JobInfo):
+        #these are already in the database, so they don't wait for room
+        self.__queue_for(job).put(job, job.priority, key=self.__queue_key(job), bounded=False)
+    
+    def __queue_for(self, job: JobInfo) -> JobQueue:
+        #summaries start in the download stage, so adding files never waits behind them
+        if job.kind == self.Functions.GET_SUMMARY.value:
+            return self.downloadQueue
+        return self.processingQueue
+    
+    def process_stage(self, stage_queue: JobQueue, step):
+        """
+        Runs one stage of the summary pipeline on the jobs handed over by the stage before it.
+        """
+        while True:
+            item = stage_queue.get()
+            if item is None:
+                return
+            
+            #the job was claimed by the download stage, so a failure here still has to be recorded
+            try:
+                step(*item)
+            except Exception as e:
+                self.__job_failed(item[0], e)
+    
+    def stop(self, timeout: float = None):
+        """
+        Stops the workers once they finish the jobs they are running. Queued jobs stay pending in the database and resume on the next start.
+        """
+        self.retry_scheduler.close()
+        for stage_queue in (self.processingQueue, self.downloadQueue, self.extractQueue, self.summarizeQueue):
+            stage_queue.close()
+        for thread in self.processing_threads:
+            thread.join(timeout)
+    
+    def service_slot(self, service: str) -> threading.BoundedSemaphore:
+        """
+        Returns the semaphore to hold while calling a service.
+        """
+        slot = self.service_slots.get(service)
+        if slot is None:
+            #setdefault so two workers meeting a new service at once still share one semaphore
+            slot = self.service_slots.setdefault(service, threading.BoundedSemaphore(DEFAULT_SERVICE_LIMIT))
+        return slot
         
+    #the kinds of job, stored in the jobs table by value
+    class Functions(enum.Enum):
+        ADD_FILE = 'add_file'
+        GET_SUMMARY = 'summarize'
     
+    def __queue_key(self, job: JobInfo):
+        #a file only needs summarizing once, so its summary job can be found again to boost it
+        if job.kind == self.Functions.GET_SUMMARY.value:
+            return ('summary', job.file_id)
+        return ('job', job.id)
         
-    def queue_add_file(self, URL: str, folderID: int, description: str = None):
+    def queue_add_file(self, URL: str, folderID: int, description: str = None, priority: int = DEFAULT_PRIORITY, block: bool = True):
         """
         Adds an external file to the database and associates it with an API key.
         
@@ -88,58 +215,132 @@ class FileOrchestrator:
             APIKeyManager (APIKeyManager): An instance of the APIKeyManager class for managing API keys.
             fileDatabase (fileDatabase): An instance of the fileDatabase class for managing files.
             folderID (int): The ID of the folder to which the file will be added.
+            priority (int): Lower runs sooner; INTERACTIVE_PRIORITY jumps ahead of bulk imports.
+            block (bool): Whether to wait while queue_size files are already waiting. The UI thread
+                passes False, and gets queue.Full back instead of freezing.
+            
+        Raises:
+            queue.Full: If block is False and queue_size files are already waiting. Nothing is
+                saved in that case, so the file can simply be added again later.
+        """
+        if block:
+            job = self.file_database.enqueue_job(self.Functions.ADD_FILE.value, priority, url=URL, folder_id=folderID, description=description)
+            
+            #bulk producers wait while the queue is full, so a huge paste can't outrun the workers
+            self.processingQueue.put(job, job.priority, key=self.__queue_key(job))
+            return
+        
+        #the job is only saved if there is room for it, so a refused file isn't run anyway on the next start
+        with self.file_database.batch():
+            job = self.file_database.enqueue_job(self.Functions.ADD_FILE.value, priority, url=URL, folder_id=folderID, description=description)
+            self.processingQueue.put(job, job.priority, key=self.__queue_key(job), timeout=0)
+    
+    def dead_letters(self, max: int = None) -> list[JobInfo]:
+        """
+        Returns the jobs that failed for good, most recent first, with the error that stopped them.
+        """
+        return self.file_database.list_jobs(JOB_FAILED, max=max)
+    
+    def replay_dead_letter(self, job_id: int) -> bool:
+        """
+        Runs a failed job again, with a fresh set of attempts.
+        
+        Returns:
+            bool: True if the job was queued, False if it isn't a failed job.
+        """
+        job = self.file_database.replay_job(job_id)
+        if job is None:
+            return False
+        
+        self.__requeue(job)
+        return True
+    
+    def prioritize_summary(self, fileID: int) -> bool:
+        """
+        Moves a file's pending summary ahead of the bulk work, e.g. because the user just selected it.
+        
+        Args:
+            fileID (int): The ID of the file.
             
         Returns:
-            bool: True if the file was successfully added, False otherwise.
+            bool: True if the file's summary was queued, False if it isn't waiting to be summarized.
         """
-        file = self.FileObject(self.FileObject.Functions.ADD_FILE, priority=1, URL=URL, folderID=folderID, fileID=None, description=description)
+        if not self.downloadQueue.boost(('summary', fileID), self.INTERACTIVE_PRIORITY):
+            return False
         
-        heapq.heappush(self.processingQueue, file)
-        with self.processing_wakeup:
-            self.processing_wakeup.notify()
+        #so it stays ahead if the app is restarted before it runs
+        self.file_database.boost_jobs(self.INTERACTIVE_PRIORITY, self.Functions.GET_SUMMARY.value, fileID)
+        return True
     
     
-    def __add_file(self, URL, folderID, description: str):
+    def __add_file(self, job: JobInfo):
+        URL = job.URL
         service_requestor = requestors.get_requestor(URL) #check if the URL is valid and get the requestor for the service
         
         #check if any of our API keys have access to the file
-        file = service_requestor.check_access(URL, self.api_key_manager)
+        with self.service_slot(service_requestor.service_name):
+            file = service_requestor.check_access(URL, self.api_key_manager)
         if(file):
-            #if we can access the file, add it to the database
-            fileID = self.file_database.add_file(name=file[1]['name'], folder_id=folderID, url=URL, description=description)
-            if not description:
-                file = self.FileObject(fileID=fileID, function=self.FileObject.Functions.GET_SUMMARY, priority=1)
-                
-                heapq.heappush(self.processingQueue, file)
-                self.processing_wakeup.notify()
+            #add the file, queue its summary and finish this job in one transaction, so a restart neither repeats nor loses any of it
+            summary_job = None
+            with self.file_database.batch():
+                fileID = self.file_database.add_file(name=file[1]['name'], folder_id=job.folder_id, url=URL, description=job.description)
+                if not job.description:
+                    summary_job = self.file_database.enqueue_job(self.Functions.GET_SUMMARY.value, job.priority, url=URL, file_id=fileID)
+                self.file_database.finish_job(job.id)
+            
+            if summary_job:
+                self.__requeue(summary_job)
         else:
             raise ValueError(f"Could not access file {URL} with any of the API keys.")
 
-    def __summarize_external_file(self, URL: str, fileID: int):
+    def __summarize_external_file(self, job: JobInfo):
         """
-        Summarizes an external file and adds it to the database.
+        Downloads an external file and hands it to the extract stage, the first step of summarizing it.
         
         Args:
-            URL (str): The path to the file to be summarized.
-            APIKeyManager (APIKeyManager): An instance of the APIKeyManager class for managing API keys.
-            fileDatabase (fileDatabase): An instance of the fileDatabase class for managing files.
-            folderID (int): The ID of the folder to which the file will be added.
-            
-        Returns:
-            bool: True if the file was successfully summarized, False otherwise.
+            job (JobInfo): The summary job, with the file's ID and URL.
         """
+        URL = job.URL
         if not URL:
             #get the URL from the database
-            file = self.file_database.get_file(fileID)
+            file = self.file_database.get_file(job.file_id)
             URL = file.URL
         
         service_requestor = requestors.get_requestor(URL)
         
-        filename = service_requestor.download_external_file(URL=URL, API_db_manager=self.api_key_manager, filename=pathlib.Path("tempfile"))
+        #every job downloads to its own file, so concurrent downloads can't overwrite each other
+        temp_path = pathlib.Path(tempfile.gettempdir()) / f"tropez-{uuid.uuid4().hex}"
+        with self.service_slot(service_requestor.service_name):
+            filename = service_requestor.download_external_file(URL=URL, API_db_manager=self.api_key_manager, filename=temp_path)
+        if not filename:
+            raise ValueError(f"Could not download file {URL}")
+        
+        try:
+            #waits while the extract stage is behind
+            self.extractQueue.put((job, filename), job.priority)
+        except Exception:
+            pathlib.Path(filename).unlink(missing_ok=True)
+            raise
+    
+    def __extract_text(self, job: JobInfo, filename: pathlib.Path):
+        try:
+            content = AISummarizerService.read_file_contents(filename)
+        finally:
+            pathlib.Path(filename).unlink(missing_ok=True)
+        
+        #an empty summary would leave the file pending forever, so fail the job where dead_letters shows it instead
+        if not content or not content.strip():
+            raise ValueError("No text could be extracted from the file")
         
-        #summarize the file
-        summary = AISummarizerService.summarize_from_external_service(filename)
+        self.summarizeQueue.put((job, content), job.priority)
+    
+    def __summarize_text(self, job: JobInfo, content: str):
+        with self.service_slot('OpenAI'):
+            summary = AISummarizerService.summarize_content(content)
         
-        #save the summary
-        self.file_database.update_file_summary(fileID, summary=summary)
+        #save the summary and finish the job together
+        with self.file_database.batch():
+            self.file_database.update_file_summary(job.file_id, summary=summary)
+            self.file_database.finish_job(job.id)
     
\ No newline at end of file
@@ -0,0 +1,140 @@
+from typing import Hashable
+import heapq
+import itertools
+import queue
+import threading
+
+
+class JobQueue:
+    #marks a heap entry whose job was boosted or taken
+    _REMOVED = object()
+
+    def __init__(self, maxsize: int = 0):
+        """
+        A thread-safe priority queue of jobs for a pool of workers.
+
+        Lower priorities come out first, and jobs of the same priority come out in the order
+        they were put in. A queued job that was given a key can later be moved up with boost.
+        With a maxsize, put blocks while the queue is full, so producers slow down to the pace
+        of the workers instead of queueing without bound.
+
+        Args:
+            maxsize (int): The most jobs queued at once (0 for no limit).
+        """
+        self.maxsize = maxsize
+
+        self._heap = []                 # [priority, sequence, job, key] entries
+        self._entries = {}              # key -> the live entry of a keyed job
+        self._count = 0                 # live jobs, as the heap also holds removed entries until they surface
+        self._sequence = itertools.count()
+        self._closed = False
+
+        #both conditions share one lock, so every change to the heap happens under it
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def put(self, job, priority: int, key: Hashable = None, bounded: bool = True, timeout: float = None) -> bool:
+        """
+        Queues a job.
+
+        Args:
+            job: The job to queue.
+            priority (int): Lower runs sooner.
+            key (Hashable): Identifies the job for boost. A job whose key is already queued is not
+                queued again; the queued one is boosted to this priority instead.
+            bounded (bool): Whether to wait for room when the queue is full. Workers queueing
+                follow-up jobs pass False, so a full queue can't leave every worker waiting on itself.
+            timeout (float): The most seconds to wait for room (None waits as long as it takes).
+
+        Returns:
+            bool: True if the job was queued, False if a job with the same key already was.
+
+        Raises:
+            queue.Full: If there was still no room after timeout seconds.
+            RuntimeError: If the queue was closed.
+        """
+        with self._not_full:
+            if key is not None and key in self._entries:
+                self._reprioritize(key, priority)
+                return False
+
+            if bounded and self.maxsize > 0:
+                if not self._not_full.wait_for(lambda: self._count < self.maxsize or self._closed, timeout):
+                    raise queue.Full
+            if self._closed:
+                raise RuntimeError("The job queue is closed")
+
+            self._push(job, priority, key)
+            self._count += 1
+            self._not_empty.notify()
+            return True
+
+    def get(self, timeout: float = None):
+        """
+        Takes the job that should run next, waiting for one if the queue is empty.
+
+        Returns:
+            The job, or None once the queue is closed or after timeout seconds without a job.
+        """
+        with self._not_empty:
+            if not self._not_empty.wait_for(lambda: self._count or self._closed, timeout) or self._closed:
+                return None
+
+            while True:
+                priority, sequence, job, key = heapq.heappop(self._heap)
+                if job is not self._REMOVED:
+                    break
+
+            if key is not None:
+                del self._entries[key]
+            self._count -= 1
+            self._not_full.notify()
+            return job
+
+    def boost(self, key: Hashable, priority: int) -> bool:
+        """
+        Moves a queued job up to a priority, behind the jobs already waiting at that priority.
+        A job already at that priority or sooner is left where it is.
+
+        Returns:
+            bool: True if a job with the key is queued.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._reprioritize(key, priority)
+            return True
+
+    def close(self):
+        """
+        Wakes every waiting worker and producer; from now on get returns None and put raises.
+        """
+        with self._lock:
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def _push(self, job, priority: int, key: Hashable):
+        entry = [priority, next(self._sequence), job, key]
+        if key is not None:
+            self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+
+    def _reprioritize(self, key: Hashable, priority: int):
+        entry = self._entries[key]
+        if entry[0] <= priority:
+            return
+
+        #heap entries can't be moved, so leave a removed marker behind and queue the job again
+        job = entry[2]
+        entry[2] = self._REMOVED
+        self._push(job, priority, key)
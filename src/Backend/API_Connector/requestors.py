@@ -4,6 +4,8 @@ from oauthlib.oauth2 import TokenExpiredError
 import pickle
 from pathlib import Path
 from Backend.API_Key_Container import AccountDB 
+from Backend.API_Connector.serviceErrors import TransientServiceError, raise_for_transient
+import requests
 
 from requests_oauthlib import OAuth2Session
 import webbrowser
@@ -33,6 +35,13 @@ class SafeOAuth2Session(OAuth2Session):
 
         return super().request(method, url, *args, **kwargs)
 
+def _transient_hook(service: str):
+    #a compliance hook that raises TransientServiceError for a 429/5xx from a token endpoint
+    def hook(response):
+        raise_for_transient(response, service)
+        return response
+    return hook
+
 #handler for OAuth Callbacks
 authorization_response = None
 server_started = threading.Event()
@@ -195,27 +204,38 @@ class GoogleDriveRequestor(APIRequestor):
         for key in keys:
             refreshToken = key[1]
             
-            #generate an access token
-            accessToken = cls.googleOAuth.refresh_token(
-                                token_url='https://oauth2.googleapis.com/token',
-                                refresh_token=refreshToken,
-                                client_id=cls.client_ID,
-                                client_secret=cls.client_secret
-                            )
-            
+            #a session per call: refresh_token stores the token on the session, which signs every request with it,
+            #so a shared session could send one key's request with another key's token
+            googleOAuth = SafeOAuth2Session(client_id=cls.client_ID)
+            #the token endpoint can be rate limited or down too, which is worth retrying like any other request
+            googleOAuth.register_compliance_hook('refresh_token_response', _transient_hook(cls.service_name))
             
-            #ask google if the file is accessible
             try:
-                response = cls.googleOAuth.get(
+                #generate an access token
+                accessToken = googleOAuth.refresh_token(
+                                    token_url='https://oauth2.googleapis.com/token',
+                                    refresh_token=refreshToken,
+                                    client_id=cls.client_ID,
+                                    client_secret=cls.client_secret
+                                )
+                
+                #ask google if the file is accessible
+                response = googleOAuth.get(
                     f"https://www.googleapis.com/drive/v3/files/{file_id}?supportsAllDrives=true&fields=id,size,name,mimeType",
                     headers={
                         'Authorization': f'Bearer {accessToken}'
                     }
                 )
                 
+                #rate limits and outages are worth retrying, unlike a key without access
+                raise_for_transient(response, cls.service_name)
                 if response.status_code == 200:
                     #if the file is accessible, return True
                     return (accessToken, response.json())
+            except TransientServiceError:
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                raise TransientServiceError(f"Could not reach {cls.service_name}: {e}") from e
             except Exception as e:
                 # Log or handle the exception as needed
                 print(f"An error occurred: {e}")
@@ -229,6 +249,9 @@ class GoogleDriveRequestor(APIRequestor):
         #ask google if the file is accessible
         try:
             if response:
+                #downloads run on several workers at once, so each gets its own session signed with the token check_access refreshed
+                googleOAuth = SafeOAuth2Session(client_id=cls.client_ID, token=response[0])
+                
                 file_size = response[1].get("size", 0)
                 file_type = response[1].get("mimeType", "unknown")
                 print(f"attempting to download {response[1].get('name')} with a detected type of {file_type}")
@@ -238,7 +261,7 @@ class GoogleDriveRequestor(APIRequestor):
                     raise ValueError("File is too large to summarize")
                 else:
                     if(file_type == "application/vnd.google-apps.document"):
-                        download_response = cls.googleOAuth.get(
+                        download_response = googleOAuth.get(
                             f"https://docs.google.com/document/d/{response[1].get('id')}/export?format=pdf",
                             headers={
                                 'Authorization': f'Bearer {response[0]}'
@@ -247,7 +270,7 @@ class GoogleDriveRequestor(APIRequestor):
                         )
                         filename = filename.with_suffix(f".pdf")
                     elif(file_type == "application/vnd.google-apps.spreadsheet"):
-                        download_response = cls.googleOAuth.get(
+                        download_response = googleOAuth.get(
                             f"https://docs.google.com/spreadsheets/d/{response[1].get('id')}/export?format=pdf",
                             headers={
                                 'Authorization': f'Bearer {response[0]}'
@@ -256,7 +279,7 @@ class GoogleDriveRequestor(APIRequestor):
                         )
                         filename = filename.with_suffix(f".pdf")
                     elif(file_type == "application/vnd.google-apps.presentation"):
-                        download_response = cls.googleOAuth.get(
+                        download_response = googleOAuth.get(
                             f"https://docs.google.com/presentation/d/{response[1].get('id')}/export/pdf",
                             headers={
                                 'Authorization': f'Bearer {response[0]}'
@@ -265,7 +288,7 @@ class GoogleDriveRequestor(APIRequestor):
                         )
                         filename = filename.with_suffix(f".pdf")
                     elif(file_type == "application/pdf"):
-                        download_response = cls.googleOAuth.get(
+                        download_response = googleOAuth.get(
                             f"https://www.googleapis.com/drive/v3/files/{response[1].get('id')}?alt=media",
                             headers={
                                 'Authorization': f'Bearer {response[0]}'
@@ -274,7 +297,7 @@ class GoogleDriveRequestor(APIRequestor):
                         )
                         filename = filename.with_suffix(f".pdf")
                     elif(file_type.startswith("text/")):
-                        download_response = cls.googleOAuth.get(
+                        download_response = googleOAuth.get(
                             f"https://www.googleapis.com/drive/v3/files/{response[1].get('id')}?alt=media",
                             headers={
                                 'Authorization': f'Bearer {response[0]}'
@@ -286,6 +309,7 @@ class GoogleDriveRequestor(APIRequestor):
                         raise ValueError("File type not supported for automatic summarizing")
                     
 
+                    raise_for_transient(download_response, cls.service_name)
                     if download_response.status_code == 200:
                         #save the file to a temporary location
                         with open(filename, "wb") as temp_file:
@@ -297,6 +321,10 @@ class GoogleDriveRequestor(APIRequestor):
                     else:
                         raise ValueError("Failed to download the file")
                 
+        except TransientServiceError:
+            raise
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            raise TransientServiceError(f"Could not reach {cls.service_name}: {e}") from e
         except Exception as e:
             # Log or handle the exception as needed
             print(f"An error occurred while downloading file: {e}")
@@ -390,8 +418,13 @@ class oneDriveRequestor(APIRequestor):
                 share_endpoint = f"https://graph.microsoft.com/v1.0/shares/u!{share_id}/driveItem?select=name,id,file"
 
                 response = oneDriveOAuth.get(share_endpoint)
+                raise_for_transient(response, cls.service_name)
                 if response.status_code == 200:
                     return (token, response.json())
+            except TransientServiceError:
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                raise TransientServiceError(f"Could not reach {cls.service_name}: {e}") from e
             except Exception as e:
                 print(f"Shared link access failed: {e}")
 
@@ -407,10 +440,15 @@ class oneDriveRequestor(APIRequestor):
                     endpoint = f"https://graph.microsoft.com/v1.0/me/drive/items/{path}?select=name,id,file"
 
                 response = oneDriveOAuth.get(endpoint)
+                raise_for_transient(response, cls.service_name)
                 if response.status_code == 200:
                     return (token, response.json())
                 else:
                     print(f"Fallback access failed: {response.status_code} - {response.text}")
+            except TransientServiceError:
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                raise TransientServiceError(f"Could not reach {cls.service_name}: {e}") from e
             except Exception as e:
                 print(f"Error trying fallback access: {e}")
 
@@ -424,6 +462,8 @@ class oneDriveRequestor(APIRequestor):
             if response:
                 file_metadata = response[1]
                 token = response[0].get('access_token')
+                #downloads run on several workers at once, so each gets its own session
+                oneDriveOAuth = SafeOAuth2Session(client_id=cls.client_ID, token=response[0])
                 file_id = file_metadata.get("id")
                 file_name = file_metadata.get("name")
                 file_type = file_metadata.get("file", {}).get("mimeType", "unknown")
@@ -432,7 +472,7 @@ class oneDriveRequestor(APIRequestor):
                 # Check if the file is a PowerPoint file
                 if file_type == 'application/vnd.openxmlformats-officedocument.presentationml.presentation':
                     # Export PowerPoint file as PDF
-                    download_response = cls.oneDriveOAuth.get(
+                    download_response = oneDriveOAuth.get(
                         f"https://graph.microsoft.com/v1.0/me/drive/items/{file_id}/content?format=pdf",
                         headers={
                             'Authorization': f'Bearer {token}'
@@ -442,7 +482,7 @@ class oneDriveRequestor(APIRequestor):
                     filename = filename.with_suffix(".pdf")
                 else:
                     # Default behavior: Download the file as-is
-                    download_response = cls.oneDriveOAuth.get(
+                    download_response = oneDriveOAuth.get(
                         f"https://graph.microsoft.com/v1.0/me/drive/items/{file_id}/content",
                         headers={
                             'Authorization': f'Bearer {token}'
@@ -451,6 +491,7 @@ class oneDriveRequestor(APIRequestor):
                     )
 
                 # Save the file
+                raise_for_transient(download_response, cls.service_name)
                 if download_response.status_code == 200:
                     with open(filename, "wb") as temp_file:
                         print(f"Saving {file_name} to {filename}")
@@ -460,6 +501,10 @@ class oneDriveRequestor(APIRequestor):
                 else:
                     raise ValueError(f"Failed to download the file: {download_response.status_code} - {download_response.text}")
 
+        except TransientServiceError:
+            raise
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            raise TransientServiceError(f"Could not reach {cls.service_name}: {e}") from e
         except Exception as e:
             print(f"An error occurred while downloading the file: {e}")
 
@@ -0,0 +1,86 @@
+from typing import Callable
+import heapq
+import itertools
+import random
+import threading
+import time
+
+
+def backoff_delay(attempt: int, base: float = 2.0, cap: float = 300.0, retry_after: float = None) -> float:
+    """
+    Returns how long to wait before retrying after a failed attempt.
+
+    The wait doubles with every attempt up to cap, and a random part of it (up to half) is
+    left out so jobs that failed together don't all retry at once. A Retry-After the service
+    sent is a lower bound.
+
+    Args:
+        attempt (int): How many attempts have failed so far (1 for the first failure).
+        base (float): The wait after the first failure, in seconds.
+        cap (float): The longest wait, in seconds.
+        retry_after (float): The seconds the service asked to wait, if it did.
+    """
+    delay = min(cap, base * 2 ** max(0, attempt - 1))
+    delay -= random.uniform(0, delay / 2)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class RetryScheduler:
+    def __init__(self, release: Callable[[object], None]):
+        """
+        Holds jobs until their retry time, then hands each one to release on a background thread.
+
+        The jobs wait in a heap ordered by due time, so one sleeping thread serves all of them
+        however many are waiting.
+
+        Args:
+            release (Callable): Called with each job once its delay is over, e.g. to queue it again.
+        """
+        self.release = release
+
+        self._heap = []                 # (due time, sequence, job) entries
+        self._sequence = itertools.count()
+        self._closed = False
+        self._wakeup = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __len__(self) -> int:
+        with self._wakeup:
+            return len(self._heap)
+
+    def schedule(self, job, delay: float):
+        """
+        Releases a job after delay seconds.
+        """
+        with self._wakeup:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), job))
+            #the new job may be due before the one the thread is sleeping on
+            self._wakeup.notify()
+
+    def close(self):
+        """
+        Stops the scheduler. The jobs still waiting are never released.
+        """
+        with self._wakeup:
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._closed and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    self._wakeup.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if self._closed:
+                    return
+                job = heapq.heappop(self._heap)[2]
+
+            #released outside the lock, as release may block on a full queue
+            try:
+                self.release(job)
+            except Exception as e:
+                print(f"Error releasing job for retry: {e}")
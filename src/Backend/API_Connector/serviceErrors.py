@@ -0,0 +1,46 @@
+from email.utils import parsedate_to_datetime
+import time
+
+
+class TransientServiceError(Exception):
+    def __init__(self, message: str, retry_after: float = None):
+        """
+        A service call that failed in a way worth retrying: rate limited (429), a server error
+        (5xx) or a connection problem.
+
+        Args:
+            message (str): What went wrong.
+            retry_after (float): The seconds the service asked to wait before retrying, if it did.
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(value: str | None) -> float | None:
+    """
+    Parses a Retry-After header, which is either a number of seconds or an HTTP date.
+
+    Returns:
+        float | None: The seconds to wait, or None if there was no usable header.
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def raise_for_transient(response, service: str):
+    """
+    Raises a TransientServiceError if an HTTP response is a 429 or a 5xx, so the job making the
+    request is retried later instead of failing for good.
+    """
+    if response.status_code == 429 or 500 <= response.status_code < 600:
+        raise TransientServiceError(f"{service} returned {response.status_code}", retry_after_seconds(response.headers.get('Retry-After')))
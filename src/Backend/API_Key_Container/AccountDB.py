@@ -1,8 +1,9 @@
-from sqlalchemy import create_engine, Column, String, LargeBinary, Integer
+from sqlalchemy import Column, String, LargeBinary, Integer
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from Backend.API_Key_Container.encryptionUtils import AESGCMSIVInterface
+from Backend.FileDatabase.engineProfile import EngineProfile, DEFAULT_PROFILE, create_tuned_engine
 
 APIBase = declarative_base()
 
@@ -21,8 +22,8 @@ class Secrets(APIBase):
     value = Column(LargeBinary, nullable=False)  # Generic value column (BLOB)
 
 class APIKeyManager:
-    def __init__(self, db_url):
-        self.engine = create_engine(db_url)
+    def __init__(self, db_url, engine_profile: EngineProfile = DEFAULT_PROFILE):
+        self.engine = create_tuned_engine(db_url, engine_profile)
         APIBase.metadata.create_all(self.engine)
         self.Session = sessionmaker(bind=self.engine)
         
@@ -0,0 +1,212 @@
+from Backend.FileDatabase.database import fileDatabase
+from Backend.FileDatabase.engineProfile import EngineProfile, DEFAULT_PROFILE, create_tuned_async_engine, for_writes
+from Backend.FileDatabase.entityCache import CacheStats
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from typing import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import asyncio
+import functools
+
+
+#fileDatabase methods that change the database, and those that only read it
+_WRITE_METHODS = (
+    'create_project', 'delete_project', 'rename_project', 'rename_folder',
+    'create_folder', 'create_folders_bulk', 'add_file', 'add_files_bulk',
+    'remove_folder', 'remove_file', 'restore_folder', 'restore_file', 'purge_deleted',
+    'move_file', 'move_folder', 'move_items', 'update_file_summary', 'rebuild_folder_stats', 'import_project',
+    'enqueue_job', 'claim_job', 'finish_job', 'fail_job', 'retry_job', 'replay_job', 'resume_jobs', 'boost_jobs',
+)
+_READ_METHODS = (
+    'list_projects', 'list_projects_with_stats', 'get_project_root',
+    'get_child_folders', 'list_folder_contents', 'get_folder_parent', 'get_child_files',
+    'get_file_parent', 'get_file_project', 'get_folder_project', 'get_folder', 'get_file',
+    'get_folder_ancestors', 'get_folder_path', 'get_folder_descendants', 'get_folder_depth',
+    'get_folder_stats', 'get_folders_stats', 'get_project_stats', 'validate_folder', 'search_files',
+    'export_project', 'list_jobs',
+)
+
+
+def _delegate(name: str, write: bool):
+    #an async method that runs the fileDatabase method of the same name on the facade's session
+    method = getattr(fileDatabase, name)
+
+    @functools.wraps(method)
+    async def call(self, *args, **kwargs):
+        return await self._run(lambda db: getattr(db, name)(*args, **kwargs), write)
+
+    return call
+
+
+async def _iterate_pages(fetch_page: Callable[[tuple], Awaitable[tuple[list, int]]], cursor_of: Callable[[tuple], tuple]) -> AsyncIterator[list]:
+    #async twin of database._iterate_pages: follow a keyset-paged listing until a short page comes back
+    cursor = None
+    while True:
+        page, page_size = await fetch_page(cursor)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        cursor = cursor_of(page[-1])
+
+
+class AsyncFileDatabase:
+    """
+    The fileDatabase API as coroutines, on SQLAlchemy's asyncio engine and aiosqlite.
+
+    Every fileDatabase read and write has an awaitable counterpart of the same name and
+    signature, and the iter_* listings are async generators. Calls run concurrently on the
+    event loop, each on its own pooled connection, without extra threads.
+
+    Usage:
+        db = AsyncFileDatabase('sqlite+aiosqlite:///project_explorer.db')
+        root = await db.get_project_root("Project A")
+        async with db.batch() as tx:
+            await tx.create_folder("Reports", parent_id=root.id)
+    """
+
+    def __init__(self, db_url='sqlite+aiosqlite:///project_explorer.db', engine_profile: EngineProfile = DEFAULT_PROFILE, cache_size: int = 4096):
+        self.engine = create_tuned_async_engine(db_url, engine_profile)
+        self.Session = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.WriteSession = async_sessionmaker(for_writes(self.engine), expire_on_commit=False)
+
+        #runs the queries; its search_enabled is filled in once the schema is ready
+        self._db = fileDatabase.__new__(fileDatabase)
+        self._db._setup(self.engine.sync_engine, False, cache_size)
+
+        #the session of the batch running in this task, if any
+        self._batch_session = ContextVar('batch_session', default=None)
+
+        self._schema_ready = False
+        self._schema_lock = asyncio.Lock()
+
+    @property
+    def cache(self):
+        return self._db.cache
+
+    @property
+    def changes(self):
+        return self._db.changes
+
+    @property
+    def search_enabled(self) -> bool:
+        return self._db.search_enabled
+
+    def cache_stats(self) -> CacheStats:
+        """
+        Returns the hit/miss counters and size of the FolderInfo/FileInfo cache.
+        """
+        return self._db.cache_stats()
+
+    async def _prepare_schema(self):
+        #the schema is created lazily because __init__ can't await
+        if self._schema_ready:
+            return
+
+        async with self._schema_lock:
+            if self._schema_ready:
+                return
+            async with self.engine.begin() as connection:
+                self._db.search_enabled = await connection.run_sync(fileDatabase.prepare_schema)
+            self._schema_ready = True
+
+    async def _run(self, call: Callable[[fileDatabase], object], write: bool):
+        await self._prepare_schema()
+
+        #inside a batch: join its session
+        batch_session = self._batch_session.get()
+        if batch_session is not None:
+            return await batch_session.run_sync(lambda session: call(self._db._bind(session)))
+
+        #standalone call: own the session and its transaction
+        async with (self.WriteSession() if write else self.Session()) as session:
+            committed = False
+            try:
+                result = await session.run_sync(lambda sync_session: call(self._db._bind(sync_session)))
+                if write:
+                    await session.commit()
+                    committed = True
+            except Exception:
+                await session.rollback()
+                raise
+            finally:
+                self._db._finish_unit(session.sync_session, committed)
+
+        return result
+
+    @asynccontextmanager
+    async def batch(self):
+        """
+        Opens a unit of work that every call awaited in this task joins.
+
+        Works like fileDatabase.batch: everything is committed when the block exits, rolled
+        back if an exception escapes it, and a call that fails inside the block only undoes
+        its own changes. Nested batches join the outermost one.
+
+        Yields:
+            AsyncFileDatabase: this database, so the block can call its methods through the alias.
+        """
+        if self._batch_session.get() is not None:
+            yield self
+            return
+
+        await self._prepare_schema()
+        async with self.WriteSession() as session:
+            token = self._batch_session.set(session)
+            committed = False
+            try:
+                yield self
+                await session.commit()
+                committed = True
+            except Exception:
+                await session.rollback()
+                raise
+            finally:
+                self._batch_session.reset(token)
+                self._db._finish_unit(session.sync_session, committed)
+
+    async def dispose(self):
+        """
+        Closes every pooled connection.
+        """
+        await self.engine.dispose()
+
+    def iter_projects(self, page_size: int = 500, sort_by: str = 'name') -> AsyncIterator[list]:
+        return _iterate_pages(
+            lambda cursor: self._page(self.list_projects(max=page_size, sort_by=sort_by, after=cursor), page_size),
+            lambda project: (getattr(project, sort_by), project.id),
+        )
+
+    def iter_projects_with_stats(self, page_size: int = 500, sort_by: str = 'name') -> AsyncIterator[list]:
+        return _iterate_pages(
+            lambda cursor: self._page(self.list_projects_with_stats(max=page_size, sort_by=sort_by, after=cursor), page_size),
+            lambda project: (getattr(project, sort_by), project.id),
+        )
+
+    def iter_child_folders(self, folder_id: int, page_size: int = 500) -> AsyncIterator[list]:
+        return _iterate_pages(
+            lambda cursor: self._page(self.get_child_folders(folder_id, max=page_size, after=cursor), page_size),
+            lambda folder: (folder.name, folder.id),
+        )
+
+    def iter_child_files(self, folder_id: int, page_size: int = 500) -> AsyncIterator[list]:
+        return _iterate_pages(
+            lambda cursor: self._page(self.get_child_files(folder_id, max=page_size, after=cursor), page_size),
+            lambda file: (file.name, file.id),
+        )
+
+    def iter_folder_contents(self, folder_id: int, sort: str = 'name', page_size: int = 500) -> AsyncIterator[list]:
+        return _iterate_pages(
+            lambda cursor: self._page(self.list_folder_contents(folder_id, sort=sort, limit=page_size, after=cursor), page_size),
+            lambda item: item,
+        )
+
+    @staticmethod
+    async def _page(listing: Awaitable[list], page_size: int) -> tuple[list, int]:
+        return await listing, page_size
+
+
+for _name in _WRITE_METHODS:
+    setattr(AsyncFileDatabase, _name, _delegate(_name, write=True))
+for _name in _READ_METHODS:
+    setattr(AsyncFileDatabase, _name, _delegate(_name, write=False))
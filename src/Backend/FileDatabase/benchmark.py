@@ -0,0 +1,249 @@
+"""
+Benchmarks fileDatabase operations on a synthetic project tree.
+
+Builds a temporary SQLite database holding projects of a configurable shape, times the hot
+paths and prints (or writes) the results as JSON so runs can be compared.
+
+Usage (from the src directory):
+    python -m Backend.FileDatabase.benchmark --files 100000 --depth 3 --fanout 8 --output bench.json
+"""
+from typing import NamedTuple, Callable
+from Backend.FileDatabase.database import fileDatabase
+
+import argparse
+import io
+import json
+import pathlib
+import platform
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import sqlalchemy
+
+
+#words used for synthetic names and summaries so searches have something to find
+VOCABULARY = (
+    "budget", "report", "quarterly", "meeting", "notes", "design", "review", "invoice", "contract",
+    "roadmap", "research", "summary", "draft", "final", "proposal", "schedule", "analysis", "plan",
+)
+
+
+'''
+class TreeShape(NamedTuple):
+    projects: int
+    files: int
+    depth: int
+    fanout: int
+'''
+class TreeShape(NamedTuple):
+    projects: int = 1       # number of projects to generate
+    files: int = 10_000     # files per project, spread evenly over its folders
+    depth: int = 3          # levels of folders below each project root
+    fanout: int = 5         # subfolders per folder
+
+
+'''
+class TimingResult(NamedTuple):
+    samples: int
+    min_ms: float
+    median_ms: float
+    p95_ms: float
+    mean_ms: float
+'''
+class TimingResult(NamedTuple):
+    samples: int
+    min_ms: float
+    median_ms: float
+    p95_ms: float
+    mean_ms: float
+
+
+def time_operation(operation: Callable[[int], object], samples: int) -> TimingResult:
+    """
+    Runs an operation several times and summarizes how long each run took.
+
+    Args:
+        operation (Callable[[int], object]): Called with the sample number.
+        samples (int): How many times to run it.
+
+    Returns:
+        TimingResult: Timings in milliseconds.
+    """
+    durations = []
+    for sample in range(samples):
+        start = time.perf_counter()
+        operation(sample)
+        durations.append((time.perf_counter() - start) * 1000)
+
+    durations.sort()
+    return TimingResult(
+        samples=samples,
+        min_ms=round(durations[0], 3),
+        median_ms=round(statistics.median(durations), 3),
+        p95_ms=round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 3),
+        mean_ms=round(statistics.fmean(durations), 3),
+    )
+
+
+def random_words(generator: random.Random, count: int) -> str:
+    return " ".join(generator.choice(VOCABULARY) for _ in range(count))
+
+
+def build_project(db: fileDatabase, name: str, shape: TreeShape, generator: random.Random) -> dict:
+    """
+    Generates one project with shape.depth levels of shape.fanout subfolders and shape.files files.
+
+    Returns:
+        dict: The project's root folder id, its folders by level and the ids of its files.
+    """
+    db.create_project(name, description=random_words(generator, 6))
+    root_id = db.get_project_root(name).id
+
+    # Build the folders one level at a time
+    levels = [[root_id]]
+    for depth in range(shape.depth):
+        requested = [(f"{random_words(generator, 1)} {depth}-{index}", parent_id)
+                     for parent_id in levels[-1] for index in range(shape.fanout)]
+        levels.append(db.create_folders_bulk(requested))
+
+    # Spread the files over every folder
+    all_folders = [folder_id for level in levels for folder_id in level]
+    file_ids = []
+    batch_size = 5000
+    for start in range(0, shape.files, batch_size):
+        requested = []
+        for index in range(start, min(start + batch_size, shape.files)):
+            summary = random_words(generator, 12) if index % 4 else None  #leave a quarter unsummarized
+            requested.append((f"{random_words(generator, 2)} {index}.pdf", all_folders[index % len(all_folders)],
+                              f"https://drive.google.com/file/d/{name}-{index}/view", summary))
+        file_ids.extend(db.add_files_bulk(requested))
+
+    return {'root': root_id, 'levels': levels, 'files': file_ids}
+
+
+def run_benchmark(shape: TreeShape, samples: int = 20, seed: int = 0, cache_size: int = 0, directory: str = None) -> dict:
+    """
+    Builds a temporary database of the given shape and times the fileDatabase hot paths.
+
+    Args:
+        shape (TreeShape): The shape of each generated project.
+        samples (int): How many times to run each operation.
+        seed (int): Seed for the generated names, so runs are reproducible.
+        cache_size (int): Size of the fileDatabase cache (0 measures the database itself).
+        directory (str): Where to put the temporary database (defaults to the system temp dir).
+
+    Returns:
+        dict: The configuration, environment and timings, ready to be dumped as JSON.
+    """
+    generator = random.Random(seed)
+    results = {}
+
+    with tempfile.TemporaryDirectory(dir=directory) as temp_dir:
+        db = fileDatabase(db_url=f"sqlite:///{pathlib.Path(temp_dir) / 'benchmark.db'}", cache_size=cache_size)
+
+        start = time.perf_counter()
+        projects = [build_project(db, f"Project {index}", shape, generator) for index in range(shape.projects)]
+        build_seconds = time.perf_counter() - start
+
+        project = projects[0]
+        root_id = project['root']
+        leaves = project['levels'][-1]
+        project_id = db.get_folder_project(root_id).id
+        files = project['files']
+
+        # Writes
+        results['add_file'] = time_operation(
+            lambda sample: db.add_file(f"added {sample}.txt", leaves[sample % len(leaves)], f"https://example.com/added/{sample}", None), samples)
+        results['update_file_summary'] = time_operation(
+            lambda sample: db.update_file_summary(files[sample % len(files)], random_words(generator, 12)), samples)
+
+        # Listings
+        results['get_child_files'] = time_operation(lambda sample: db.get_child_files(root_id), samples)
+        results['get_child_files_first_page'] = time_operation(lambda sample: db.get_child_files(root_id, max=100), samples)
+        results['get_child_folders'] = time_operation(lambda sample: db.get_child_folders(root_id), samples)
+        results['list_folder_contents_first_page'] = time_operation(lambda sample: db.list_folder_contents(root_id, limit=100), samples)
+        results['iter_folder_contents'] = time_operation(
+            lambda sample: sum(len(page) for page in db.iter_folder_contents(root_id, page_size=500)), samples)
+        results['list_projects'] = time_operation(lambda sample: db.list_projects(), samples)
+        results['list_projects_with_stats'] = time_operation(lambda sample: db.list_projects_with_stats(max=100), samples)
+
+        # Lookups
+        results['get_file'] = time_operation(lambda sample: db.get_file(files[-1 - sample % len(files)]), samples)
+        results['get_folder_path'] = time_operation(lambda sample: db.get_folder_path(leaves[sample % len(leaves)]), samples)
+        results['get_folder_descendants'] = time_operation(lambda sample: db.get_folder_descendants(root_id), samples)
+        results['get_project_stats'] = time_operation(lambda sample: db.get_project_stats(project_id), samples)
+
+        # Search
+        results['search_files'] = time_operation(
+            lambda sample: db.search_files(VOCABULARY[sample % len(VOCABULARY)], limit=50), samples)
+        results['search_files_in_project'] = time_operation(
+            lambda sample: db.search_files(random_words(generator, 2), project_id=project_id, limit=50), samples)
+
+        # Snapshots: export the first project, then import it into an empty database
+        results['export_project'] = time_operation(lambda sample: db.export_project(project_id, io.StringIO()), max(1, samples // 5))
+        snapshot = io.StringIO()
+        db.export_project(project_id, snapshot)
+        copy_db = fileDatabase(db_url=f"sqlite:///{pathlib.Path(temp_dir) / 'import.db'}", cache_size=cache_size)
+        results['import_project'] = time_operation(lambda sample: copy_db.import_project(io.StringIO(snapshot.getvalue())), 1)
+        copy_db.engine.dispose()
+
+        # Moves: shuttle a top-level subtree between two parents
+        if len(project['levels']) > 2:
+            moved_folder = project['levels'][1][0]
+            targets = [project['levels'][1][-1], root_id]
+            results['move_folder'] = time_operation(lambda sample: db.move_folder(moved_folder, targets[sample % 2]), samples)
+        results['move_file'] = time_operation(
+            lambda sample: db.move_file(files[sample % len(files)], leaves[(sample + 1) % len(leaves)]), samples)
+
+        # Deletes: one subtree per sample, then whole projects
+        if len(project['levels']) > 2:
+            doomed = project['levels'][1][1:][:samples]
+            results['remove_folder'] = time_operation(lambda sample: db.remove_folder(doomed[sample]), len(doomed))
+            #the removed subtrees are left as tombstones; time purging them a bounded batch at a time
+            results['purge_deleted'] = time_operation(lambda sample: db.purge_deleted(max_rows=1000), samples)
+        results['delete_project'] = time_operation(lambda sample: db.delete_project(f"Project {sample}"), shape.projects)
+
+        db.engine.dispose()
+
+    return {
+        'config': {'shape': shape._asdict(), 'samples': samples, 'seed': seed, 'cache_size': cache_size},
+        'environment': {
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+        },
+        'build_seconds': round(build_seconds, 3),
+        'results': {name: timing._asdict() for name, timing in results.items()},
+    }
+
+
+def main(argv: list[str] = None):
+    defaults = TreeShape()
+    parser = argparse.ArgumentParser(description="Benchmark fileDatabase operations on a synthetic project tree.")
+    parser.add_argument("--projects", type=int, default=defaults.projects, help="number of projects to generate")
+    parser.add_argument("--files", type=int, default=defaults.files, help="files per project")
+    parser.add_argument("--depth", type=int, default=defaults.depth, help="levels of folders below each root")
+    parser.add_argument("--fanout", type=int, default=defaults.fanout, help="subfolders per folder")
+    parser.add_argument("--samples", type=int, default=20, help="runs per timed operation")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the generated names")
+    parser.add_argument("--cache-size", type=int, default=0, help="fileDatabase cache size (0 disables it)")
+    parser.add_argument("--tmpdir", default=None, help="directory for the temporary database")
+    parser.add_argument("--output", default=None, help="write the JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    shape = TreeShape(projects=args.projects, files=args.files, depth=args.depth, fanout=args.fanout)
+    report = run_benchmark(shape, samples=args.samples, seed=args.seed, cache_size=args.cache_size, directory=args.tmpdir)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        pathlib.Path(args.output).write_text(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
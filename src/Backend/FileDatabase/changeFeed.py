@@ -0,0 +1,155 @@
+from typing import NamedTuple, Callable, Hashable
+from collections import deque
+import itertools
+import enum
+import queue
+import threading
+
+
+class ChangeType(enum.Enum):
+    CREATED = 1           # also sent when a removed item is restored
+    MOVED = 2
+    RENAMED = 3
+    SUMMARY_UPDATED = 4
+    DELETED = 5
+
+
+'''
+class ChangeEvent(NamedTuple):
+    type: ChangeType
+    kind: str
+    id: int
+    parent_id: int
+    name: str
+    description: str
+    old_parent_id: int
+    sequence: int
+'''
+class ChangeEvent(NamedTuple):
+    type: ChangeType
+    kind: str                   # 'project', 'folder' or 'file'
+    id: int
+    parent_id: int = None       # the folder it is in (None for projects and root folders)
+    name: str = None
+    description: str = None     # a file's summary, on CREATED, MOVED and SUMMARY_UPDATED
+    old_parent_id: int = None   # the folder it left, on MOVED
+    sequence: int = 0           # assigned by the feed when the change is committed
+
+
+class ChangeFeed:
+    def __init__(self, history: int = 10000):
+        """
+        Hands the changes committed to a fileDatabase to whoever subscribed to them.
+
+        Every committed unit of work is published as one list of events, in commit order,
+        with sequence numbers that only ever increase. A unit reserves its place in that order
+        while it still holds the database's write lock, and a unit that finishes before the
+        ones ahead of it waits for them to be published first. Subscribers are called on the thread
+        that committed, so they should be quick; GUI code should subscribe a queue and
+        drain it from its own event loop instead.
+
+        Args:
+            history (int): How many recent events to keep for changes_since.
+        """
+        self._history = deque(maxlen=history)
+        self._subscribers = {}
+        self._sequence = 0
+
+        #tickets handed out by reserve, the next one to publish, and the units that finished ahead of it
+        self._tickets = itertools.count()
+        self._next_ticket = 0
+        self._waiting = {}
+
+        #held while numbering and delivering, so every subscriber sees the lists in sequence order
+        self._lock = threading.RLock()
+
+    @property
+    def last_sequence(self) -> int:
+        """
+        The sequence number of the latest published event (0 before the first one).
+        """
+        with self._lock:
+            return self._sequence
+
+    def subscribe(self, callback: Callable[[list[ChangeEvent]], None]) -> Callable[[list[ChangeEvent]], None]:
+        """
+        Calls callback with the list of events of every unit of work committed from now on.
+
+        Returns:
+            Callable: The callback, to pass to unsubscribe.
+        """
+        with self._lock:
+            self._subscribers[callback] = callback
+        return callback
+
+    def subscribe_queue(self) -> queue.Queue:
+        """
+        Puts the list of events of every unit of work committed from now on into a new queue.
+
+        Returns:
+            queue.Queue: The queue, to drain with get_nowait and to pass to unsubscribe.
+        """
+        #unbounded, so a slow consumer never blocks the thread that committed
+        changes = queue.Queue()
+        with self._lock:
+            self._subscribers[changes] = changes.put
+        return changes
+
+    def unsubscribe(self, subscriber: Hashable):
+        """
+        Stops delivering to a callback or queue. Does nothing if it wasn't subscribed.
+        """
+        with self._lock:
+            self._subscribers.pop(subscriber, None)
+
+    def changes_since(self, sequence: int) -> list[ChangeEvent] | None:
+        """
+        Returns the events published after a sequence number, to catch up after a pause.
+
+        Returns:
+            list[ChangeEvent] | None: The events, oldest first, or None if some of them are
+                no longer in the history and the consumer has to re-read everything.
+        """
+        with self._lock:
+            if sequence >= self._sequence:
+                return []
+            if not self._history or self._history[0].sequence > sequence + 1:
+                return None
+            return [event for event in self._history if event.sequence > sequence]
+
+    def reserve(self) -> int:
+        """
+        Reserves a unit of work's place in the publishing order. Every ticket must be published,
+        with no events if the unit rolled back.
+
+        Returns:
+            int: The ticket to pass to publish.
+        """
+        with self._lock:
+            return next(self._tickets)
+
+    def publish(self, events: list[ChangeEvent], ticket: int):
+        """
+        Publishes the events of one committed unit of work once every unit with an earlier ticket
+        has been published, numbering them and delivering them to every subscriber.
+        """
+        with self._lock:
+            self._waiting[ticket] = events
+            while self._next_ticket in self._waiting:
+                self._deliver(self._waiting.pop(self._next_ticket))
+                self._next_ticket += 1
+
+    def _deliver(self, events: list[ChangeEvent]):
+        if not events:
+            return
+
+        first = self._sequence + 1
+        events = [event._replace(sequence=sequence) for sequence, event in enumerate(events, first)]
+        self._sequence += len(events)
+        self._history.extend(events)
+
+        for deliver in list(self._subscribers.values()):
+            try:
+                deliver(events)
+            except Exception as e:
+                print(f"Error delivering changes: {e}")
@@ -1,8 +1,25 @@
 from typing import NamedTuple
-from sqlalchemy import create_engine, Column, String, Integer, ForeignKey
+from sqlalchemy import insert, select, update, delete, union_all, null, case, and_, Index, or_, func, literal, tuple_, bindparam, exists, text, literal_column, Column, Boolean, String, Integer, Float, ForeignKey
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import table, column
+from Backend.FileDatabase.engineProfile import EngineProfile, DEFAULT_PROFILE, create_tuned_engine, for_writes
+from Backend.FileDatabase.entityCache import LRUCache, CacheStats
+from Backend.FileDatabase.changeFeed import ChangeFeed, ChangeEvent, ChangeType
+from Backend.FileDatabase.migrations import REBUILD_FOLDER_STATS_SQL, migrate
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.orm import aliased, relationship, sessionmaker
 from os.path import normpath
+from typing import Callable, Iterator, TextIO
+from contextlib import contextmanager
+from types import SimpleNamespace
+from collections import defaultdict, deque
+import threading
+import copy
+import itertools
+import json
+import re
+import time
 
 
 # Return Types
@@ -41,24 +58,161 @@ class FileInfo(NamedTuple):
     URL: str
     description: str
 
+'''
+class FolderColumns(NamedTuple):
+    ids: list[int]
+    names: list[str]
+'''
+class FolderColumns(NamedTuple):
+    ids: list[int]
+    names: list[str]
+
+'''
+class FileColumns(NamedTuple):
+    ids: list[int]
+    names: list[str]
+    URLs: list[str]
+    descriptions: list[str]
+'''
+class FileColumns(NamedTuple):
+    ids: list[int]
+    names: list[str]
+    URLs: list[str]
+    descriptions: list[str]
+
+'''
+class DeleteResult(NamedTuple):
+    projects: int
+    folders: int
+    files: int
+'''
+class DeleteResult(NamedTuple):
+    projects: int
+    folders: int
+    files: int
+
+'''
+class FolderStats(NamedTuple):
+    files: int
+    folders: int
+    total_files: int
+    total_folders: int
+    summarized_files: int
+    pending_files: int
+'''
+class FolderStats(NamedTuple):
+    files: int              # files directly in the folder
+    folders: int            # subfolders directly in the folder
+    total_files: int        # files anywhere in the folder's subtree
+    total_folders: int      # folders anywhere below the folder
+    summarized_files: int   # files in the subtree that have a summary
+    pending_files: int      # files in the subtree still waiting for one
+
+'''
+class ProjectStats(NamedTuple):
+    id: int
+    name: str
+    description: str
+    status: str
+    files: int
+    folders: int
+    summarized_files: int
+    pending_files: int
+'''
+class ProjectStats(NamedTuple):
+    id: int
+    name: str
+    description: str
+    status: str
+    files: int
+    folders: int
+    summarized_files: int
+    pending_files: int
+'''
+class TransferResult(NamedTuple):
+    project_id: int
+    folders: int
+    files: int
+'''
+class TransferResult(NamedTuple):
+    project_id: int
+    folders: int
+    files: int
+
+'''
+class JobInfo(NamedTuple):
+    id: int
+    kind: str
+    state: str
+    priority: int
+    URL: str
+    folder_id: int
+    file_id: int
+    description: str
+    attempts: int
+    last_error: str
+    created_at: float
+    updated_at: float
+    run_after: float
+'''
+class JobInfo(NamedTuple):
+    id: int
+    kind: str               # what to do, as named by whoever queued it
+    state: str              # JOB_PENDING, JOB_RUNNING, JOB_DONE or JOB_FAILED
+    priority: int           # lower runs sooner
+    URL: str
+    folder_id: int
+    file_id: int
+    description: str
+    attempts: int           # how many times a worker claimed it
+    last_error: str         # why the last attempt failed, if it did
+    created_at: float
+    updated_at: float
+    run_after: float        # when a job waiting to be retried may run again (time.time())
+
 
 FileBase = declarative_base()
 
 class Project(FileBase):
     __tablename__ = 'projects'
+    __table_args__ = (
+        #backs keyset paging by status (name is already indexed by its unique constraint)
+        Index('ix_projects_status_id', 'status', 'id'),
+        #backs keyset paging by name, which sorts case-insensitively
+        Index('ix_projects_name_nocase_id', text('name COLLATE NOCASE'), 'id'),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String, nullable=False, unique=True)
     description = Column(String, nullable=True)
     status = Column(String, default='In Progress')
-    root_folder_id = Column(Integer, ForeignKey('folders.id'), nullable=True)
+    root_folder_id = Column(Integer, ForeignKey('folders.id'), nullable=True, index=True)
     folders = relationship('Folder', back_populates='project', cascade='all, delete-orphan', foreign_keys='Folder.project_id')
 
 class Folder(FileBase):
     __tablename__ = 'folders'
+    __table_args__ = (
+        #backs lookups by parent and the name collision checks
+        Index('ix_folders_parent_name_id', 'parent_id', 'name', 'id'),
+        #backs keyset paging of a folder's subfolders by (name, id), which sorts case-insensitively
+        Index('ix_folders_parent_name_nocase_id', 'parent_id', text('name COLLATE NOCASE'), 'id'),
+        #only tombstones are indexed, so finding them stays cheap however big the table is
+        Index('ix_folders_deleted_at', 'deleted_at', sqlite_where=text('deleted_at IS NOT NULL')),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String, nullable=False)
-    project_id = Column(Integer, ForeignKey('projects.id'), nullable=False)
-    parent_id = Column(Integer, ForeignKey('folders.id'), nullable=True, index=True)
+    project_id = Column(Integer, ForeignKey('projects.id'), nullable=False, index=True)
+    parent_id = Column(Integer, ForeignKey('folders.id'), nullable=True)
+    #materialized ancestry: ids of every ancestor from the root down, e.g. '/1/5/' ('/' for a root folder)
+    path = Column(String, nullable=True, index=True)
+    depth = Column(Integer, nullable=False, default=0)
+    #aggregate counters kept up to date by the mutators: the folder's direct children, then its whole subtree
+    file_count = Column(Integer, nullable=False, default=0)
+    folder_count = Column(Integer, nullable=False, default=0)
+    total_file_count = Column(Integer, nullable=False, default=0)
+    total_folder_count = Column(Integer, nullable=False, default=0)
+    summarized_file_count = Column(Integer, nullable=False, default=0)
+    #tombstone: when remove_folder hid this folder and everything below it, until purge_deleted deletes them
+    deleted_at = Column(Float, nullable=True)
     project = relationship('Project', back_populates='folders', foreign_keys=project_id)
     parent = relationship('Folder', remote_side=[id], back_populates='children', foreign_keys=parent_id)
     children = relationship('Folder', back_populates='parent', cascade='all, delete-orphan')
@@ -66,81 +220,514 @@ class Folder(FileBase):
 
 class File(FileBase):
     __tablename__ = 'files'
+    __table_args__ = (
+        #backs lookups by folder and the name collision checks
+        Index('ix_files_folder_name_id', 'folder_id', 'name', 'id'),
+        #backs keyset paging of a folder's files by (name, id), which sorts case-insensitively
+        Index('ix_files_folder_name_nocase_id', 'folder_id', text('name COLLATE NOCASE'), 'id'),
+        Index('ix_files_deleted_at', 'deleted_at', sqlite_where=text('deleted_at IS NOT NULL')),
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     URL = Column(String, nullable=False, unique=True)
     name = Column(String, nullable=False)
     description = Column(String, nullable=True)
-    folder_id = Column(Integer, ForeignKey('folders.id'), nullable=False, index=True)
+    folder_id = Column(Integer, ForeignKey('folders.id'), nullable=False)
+    #tombstone: when remove_file hid this file, until purge_deleted deletes it
+    deleted_at = Column(Float, nullable=True)
     folder = relationship('Folder', back_populates='files', foreign_keys=folder_id)
 
+#a job is pending until a worker claims it, then done, failed if it couldn't be, or pending again to be retried
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+class Job(FileBase):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        #backs resuming the pending jobs in the order they should run
+        Index('ix_jobs_state_priority_id', 'state', 'priority', 'id'),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String, nullable=False)
+    state = Column(String, nullable=False, default=JOB_PENDING)
+    priority = Column(Integer, nullable=False, default=0)
+    #what the job works on; plain ids, as a job can outlive the folder or file it was queued for
+    URL = Column(String, nullable=True)
+    folder_id = Column(Integer, nullable=True)
+    file_id = Column(Integer, nullable=True)
+    description = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String, nullable=True)
+    created_at = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False)
+    run_after = Column(Float, nullable=True)
+
+_JOB_COLUMNS = (Job.id, Job.kind, Job.state, Job.priority, Job.URL, Job.folder_id, Job.file_id, Job.description,
+                Job.attempts, Job.last_error, Job.created_at, Job.updated_at, Job.run_after)
+
+def _subtree_prefix(path: str, folder_id: int) -> str:
+    #the path shared by every descendant of a folder
+    return f"{path}{folder_id}/"
+
+def _within_subtree(prefix: str):
+    #range form of "path LIKE prefix%", so the path index is used ('0' sorts right after '/')
+    return and_(Folder.path >= prefix, Folder.path < prefix[:-1] + '0')
+
+def _ancestor_ids(path: str) -> list[int]:
+    return [int(part) for part in path.strip('/').split('/') if part]
+
+def _parent_path(path: str) -> str:
+    #the path of a folder's parent, given the folder's own path
+    return path[:path.rstrip('/').rfind('/') + 1]
+
+def _live_folder(folder: str = 'folders'):
+    #a folder is live unless it or one of its ancestors has a tombstone; the check only scans the (few) tombstones.
+    #written as one SQL fragment because the equivalent expression tree costs more to build and cache-key than to run
+    return literal_column(f"""({folder}.deleted_at IS NULL AND NOT EXISTS (
+        SELECT 1 FROM folders AS tombstone WHERE tombstone.deleted_at IS NOT NULL
+        AND {folder}.path >= tombstone.path || tombstone.id || '/' AND {folder}.path < tombstone.path || tombstone.id || '0'))""", Boolean)
+
+_LIVE_FOLDER = _live_folder()
+#for queries that join each file to its Folder
+_LIVE_FILE = and_(File.deleted_at.is_(None), _LIVE_FOLDER)
+#for scans over many files: the folders hidden by tombstones are listed once, instead of checking every file's ancestry
+_IN_LIVE_FOLDER = literal_column("""files.folder_id NOT IN (
+    SELECT below.id FROM folders AS tombstone JOIN folders AS below
+      ON below.id = tombstone.id OR (below.path >= tombstone.path || tombstone.id || '/' AND below.path < tombstone.path || tombstone.id || '0')
+    WHERE tombstone.deleted_at IS NOT NULL)""", Boolean)
+#for the folder whose contents list_folder_contents lists
+_listed = aliased(Folder, name='listed')
+_LIVE_LISTED = _live_folder('listed')
+
+#the counters on Folder, in the order _StatChanges keeps them
+_STAT_COLUMNS = ('file_count', 'folder_count', 'total_file_count', 'total_folder_count', 'summarized_file_count')
+
+def _is_summarized(description: str) -> bool:
+    return bool(description)
+
+def _folder_stats(row) -> FolderStats:
+    return FolderStats(row.file_count, row.folder_count, row.total_file_count, row.total_folder_count,
+                       row.summarized_file_count, row.total_file_count - row.summarized_file_count)
+
+class _StatChanges:
+    #accumulates counter deltas per folder so a whole operation updates them with one executemany
+    def __init__(self):
+        self._deltas = defaultdict(lambda: [0] * len(_STAT_COLUMNS))
+
+    def add(self, parent_id: int, parent_path: str, files: int = 0, folders: int = 0, total_files: int = 0, total_folders: int = 0, summarized: int = 0):
+        #direct counters only change on the parent, subtree counters on the parent and every ancestor
+        delta = self._deltas[parent_id]
+        delta[0] += files
+        delta[1] += folders
+        for folder_id in (*_ancestor_ids(parent_path), parent_id):
+            delta = self._deltas[folder_id]
+            delta[2] += total_files
+            delta[3] += total_folders
+            delta[4] += summarized
+
+    def apply(self, session):
+        rows = [{'folder_id': folder_id, **{f'delta_{name}': value for name, value in zip(_STAT_COLUMNS, delta)}}
+                for folder_id, delta in self._deltas.items() if any(delta)]
+        self._deltas.clear()
+        if not rows:
+            return
+
+        folders_table = Folder.__table__
+        session.execute(
+            update(folders_table)
+            .where(folders_table.c.id == bindparam('folder_id'))
+            .values({name: folders_table.c[name] + bindparam(f'delta_{name}') for name in _STAT_COLUMNS}),
+            rows,
+        )
+
+class _AncestryChanges:
+    #folders recently removed or moved, so a cached row can tell whether one of its ancestors changed since it was read
+    def __init__(self, max_folders: int = 1024):
+        self.max_folders = max_folders
+        self.epoch = 0
+
+        self._folders = deque()         # (epoch, folder id) entries, oldest first
+        self._forgotten = 0             # the newest epoch dropped from the log
+        self._lock = threading.Lock()
+
+    def record(self, *folder_ids: int):
+        with self._lock:
+            self.epoch += 1
+            for folder_id in folder_ids:
+                self._folders.append((self.epoch, folder_id))
+            while len(self._folders) > self.max_folders:
+                self._forgotten = self._folders.popleft()[0]
+
+    def unchanged_since(self, epoch: int, ancestor_ids: tuple[int, ...]) -> bool:
+        with self._lock:
+            if epoch == self.epoch:
+                return True
+            if epoch < self._forgotten:
+                return False
+            for changed_epoch, folder_id in reversed(self._folders):
+                if changed_epoch <= epoch:
+                    return True
+                if folder_id in ancestor_ids:
+                    return False
+            return True
+
+_SEARCH_INSERT_TRIGGER = """CREATE TRIGGER files_fts_insert AFTER INSERT ON files BEGIN
+        INSERT INTO files_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END"""
+
+#FTS5 index over file names and summaries, kept in sync with the files table by triggers
+_SEARCH_INDEX_DDL = (
+    """CREATE VIRTUAL TABLE files_fts USING fts5(
+        name, description, content='files', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    _SEARCH_INSERT_TRIGGER,
+    """CREATE TRIGGER files_fts_delete AFTER DELETE ON files BEGIN
+        INSERT INTO files_fts(files_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    """CREATE TRIGGER files_fts_update AFTER UPDATE OF name, description ON files BEGIN
+        INSERT INTO files_fts(files_fts, rowid, name, description) VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO files_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    #index the rows that were already there
+    "INSERT INTO files_fts(files_fts) VALUES ('rebuild')",
+)
+
+_files_fts = table('files_fts', column('rowid'), column('files_fts'))
+
+#matches on the name count ten times as much as matches in the summary
+_SEARCH_RANK = func.bm25(_files_fts.c.files_fts, 10.0, 1.0)
+
+def _search_terms(query: str) -> list[str]:
+    return re.findall(r"\w+", query)
+
+#names sort (and keyset page) case-insensitively, the way the UI has always shown them
+_FOLDER_NAME_ORDER = Folder.name.collate('NOCASE')
+_FILE_NAME_ORDER = File.name.collate('NOCASE')
+
+#columns list_projects can be ordered (and keyset paged) by
+_PROJECT_SORT_KEYS = {
+    'name': Project.name.collate('NOCASE'),
+    'status': Project.status,
+}
+
+#columns list_projects_with_stats can be ordered by; the counts come from each project's root folder
+_PROJECT_STATS_SORT_KEYS = {
+    **_PROJECT_SORT_KEYS,
+    'files': Folder.total_file_count,
+    'pending_files': Folder.total_file_count - Folder.summarized_file_count,
+}
+
+def _iterate_pages(fetch_page: Callable[[tuple], list], cursor_of: Callable[[tuple], tuple]) -> Iterator[list]:
+    #follow a keyset-paged listing until a short page comes back
+    cursor = None
+    while True:
+        page, page_size = fetch_page(cursor)
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        cursor = cursor_of(page[-1])
+
+#orders list_folder_contents can return, as the columns they sort by ('kind' is 0 for folders and 1 for files)
+_CONTENTS_SORT_KEYS = {
+    'name': ('name', 'kind', 'id'),
+    'type': ('kind', 'name', 'id'),
+}
+
+#keep IN (...) lists under SQLite's bound parameter limit
+_MAX_IN_PARAMS = 900
+
+def _chunked(items: list, size: int = _MAX_IN_PARAMS):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _fetch_rows(session, statement) -> list:
+    #column-only selects run on the session's connection, skipping the ORM's per-row result processing
+    return session.connection().execute(statement).all()
+
+def _claim_urls(session, urls: list[str]):
+    #a removed file keeps its URL until it is purged: purge those files now so the URLs can be added again
+    for chunk in _chunked(urls):
+        holders = session.execute(
+            select(File.id, File.URL, _LIVE_FILE.label('live')).join(Folder, Folder.id == File.folder_id).where(File.URL.in_(chunk))
+        ).all()
+        for holder in holders:
+            if holder.live:
+                raise ValueError(f"File with URL '{holder.URL}' already exists.")
+        if holders:
+            session.execute(delete(File).where(File.id.in_([holder.id for holder in holders])).execution_options(synchronize_session=False))
+
+#version of the export_project format, written on its first line
+_EXPORT_FORMAT = 1
+
+#rows fetched per round trip by export_project, and inserted per statement by import_project
+_TRANSFER_BATCH = 5000
+
+def _json_line(record: dict) -> str:
+    return json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n'
+
+def _project_condition(project_identifier: int | str):
+    #the WHERE clause for a project passed by id or by name
+    if isinstance(project_identifier, int):
+        return Project.id == project_identifier
+    if isinstance(project_identifier, str):
+        return Project.name == project_identifier
+    raise ValueError("Identifier must be an integer or string.")
+
+def _as_columns(columns_type, rows) -> NamedTuple:
+    #transpose result rows into one list per column
+    columns = [list(values) for values in zip(*rows)]
+    return columns_type(*columns) if columns else columns_type(*([] for _ in columns_type._fields))
+
 class fileDatabase:
-    def __init__(self, db_url='sqlite:///project_explorer.db'):
-        self.engine = create_engine(db_url)
-        FileBase.metadata.create_all(self.engine)
+    def __init__(self, db_url='sqlite:///project_explorer.db', engine_profile: EngineProfile = DEFAULT_PROFILE, cache_size: int = 4096):
+        engine = create_tuned_engine(db_url, engine_profile)
+        with engine.begin() as connection:
+            search_enabled = self.prepare_schema(connection)
+        self._setup(engine, search_enabled, cache_size)
+
+    def _setup(self, engine: Engine, search_enabled: bool, cache_size: int):
+        #everything but the schema, so AsyncFileDatabase can build one on its own engine
+        self.engine = engine
+        self.search_enabled = search_enabled
         self.Session = sessionmaker(bind=self.engine)
-        
-    def create_project(self, name: str, description: str =None):
-        session = self.Session()
-        
+        self.WriteSession = sessionmaker(bind=for_writes(self.engine))
+
+        #the session of the batch (unit of work) running on this thread, if any
+        self._local = threading.local()
+
+        #read-through cache of FolderInfo/FileInfo by id (with the ancestry they were read under), invalidated by the mutators
+        self.cache = LRUCache(cache_size)
+        #removing or moving a folder doesn't drop the cached rows below it: they check this when they are read
+        self._ancestry_changes = _AncestryChanges()
+
+        #the changes of every committed unit of work, for subscribers to apply instead of re-reading
+        self.changes = ChangeFeed()
+
+    @staticmethod
+    def prepare_schema(connection: Connection) -> bool:
+        """
+        Creates or migrates the tables and indexes on a connection, then sets up the search index.
+
+        Databases already at the current schema version are left alone, so this is cheap on
+        every start but the first.
+
+        Returns:
+            bool: Whether full-text search is available.
+        """
+        migrate(connection, FileBase.metadata)
+        return fileDatabase._create_search_index(connection)
+
+    @staticmethod
+    def _create_search_index(connection: Connection) -> bool:
+        #full-text search needs SQLite built with FTS5; search_files falls back to LIKE without it
+        if connection.dialect.name != 'sqlite':
+            return False
+
+        if connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'files_fts'").first():
+            return True
+
+        try:
+            with connection.begin_nested():
+                for statement in _SEARCH_INDEX_DDL:
+                    connection.exec_driver_sql(statement)
+        except OperationalError:
+            return False
+
+        return True
+
+    @contextmanager
+    def batch(self):
+        """
+        Opens a unit of work that every fileDatabase method called on this thread joins.
+
+        All calls inside the block share one session and one transaction, which is committed
+        when the block exits and rolled back if an exception escapes it. A call that fails
+        inside the block only rolls back its own changes, so the caller can catch the error
+        and keep going. Nested batches join the outermost one.
+
+        Usage:
+            with db.batch() as tx:
+                tx.create_folder("Reports", parent_id=root.id)
+                tx.add_file("Q1", folder_id=folder.id, url=url, description=None)
+
+        Yields:
+            fileDatabase: this database, so the block can call its methods through the alias.
+        """
+        if getattr(self._local, 'session', None) is not None:
+            yield self
+            return
+
+        session = self.WriteSession()
+        self._local.session = session
+        committed = False
+        try:
+            yield self
+            session.commit()
+            committed = True
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            self._local.session = None
+            self._finish_unit(session, committed)
+            session.close()
+
+    @contextmanager
+    def _session_scope(self, write: bool = False):
+        batch_session = getattr(self._local, 'session', None)
+
+        #standalone call: own the session and its transaction
+        if batch_session is None:
+            session = self.WriteSession() if write else self.Session()
+            committed = False
+            try:
+                yield session
+                if write:
+                    session.commit()
+                    committed = True
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                self._finish_unit(session, committed)
+                session.close()
+            return
+
+        #inside a batch: reads share the session, writes get a savepoint so a failure only undoes this call
+        if not write:
+            yield batch_session
+            return
+
+        savepoint = batch_session.begin_nested()
+        recorded = len(batch_session.info.get('changes', ()))
         try:
+            yield batch_session
+            if savepoint.is_active:
+                savepoint.commit()
+        except Exception:
+            if savepoint.is_active:
+                savepoint.rollback()
+            #the changes this call recorded were rolled back with it
+            del batch_session.info.get('changes', [])[recorded:]
+            raise
+
+    def _bind(self, session) -> 'fileDatabase':
+        #a view of this database whose calls all join the given session, the way calls inside a batch do
+        bound = copy.copy(self)
+        bound._local = SimpleNamespace(session=session)
+        return bound
+
+    def _invalidate(self, session, *keys):
+        #drop now so this unit of work reads fresh rows, and again once it ends in case another thread re-cached the old row meanwhile
+        self.cache.invalidate(*keys)
+        session.info.setdefault('invalidated', set()).update(keys)
+
+    def _invalidate_below(self, session, *folder_ids):
+        #like _invalidate, for the cached rows anywhere below the folders, which find out when they are next read
+        self._ancestry_changes.record(*folder_ids)
+        session.info.setdefault('invalidated_below', set()).update(folder_ids)
+
+    def _flush_invalidations(self, session):
+        keys = session.info.pop('invalidated', None)
+        if keys:
+            self.cache.invalidate(*keys)
+        folder_ids = session.info.pop('invalidated_below', None)
+        if folder_ids:
+            self._ancestry_changes.record(*folder_ids)
+
+    def _record(self, session, *events: ChangeEvent):
+        #published once the unit of work commits, dropped if it rolls back
+        if 'change_ticket' not in session.info:
+            #take the feed's ticket while holding SQLite's write lock (BEGIN IMMEDIATE), which is only
+            #released by the commit, so tickets follow commit order even if units finish out of order
+            session.connection()
+            session.info['change_ticket'] = self.changes.reserve()
+        session.info.setdefault('changes', []).extend(events)
+
+    def _finish_unit(self, session, committed: bool):
+        #the cache goes first, so subscribers reacting to a change don't read the old rows back from it
+        self._flush_invalidations(session)
+        changes = session.info.pop('changes', None)
+        ticket = session.info.pop('change_ticket', None)
+        if ticket is not None:
+            #a unit that rolled back still hands its ticket back, or the units after it would wait forever
+            self.changes.publish(changes if committed else [], ticket)
+
+    def _cache_put(self, key, value, token: int):
+        #rows read inside a batch may never be committed, so only standalone reads are cached
+        if getattr(self._local, 'session', None) is None:
+            self.cache.put(key, value, token)
+
+    def _delete_folders(self, session, folder_condition) -> tuple[list[int], list[int]]:
+        #set-based delete of the folders matching the condition and every file in them, instead of loading them for the ORM cascade
+        folder_ids = select(Folder.id).where(folder_condition)
+        deleted_files = session.scalars(
+            delete(File).where(File.folder_id.in_(folder_ids)).returning(File.id).execution_options(synchronize_session='fetch')
+        ).all()
+        deleted_folders = session.scalars(
+            delete(Folder).where(folder_condition).returning(Folder.id).execution_options(synchronize_session='fetch')
+        ).all()
+
+        self._invalidate(session, *[('folder', folder_id) for folder_id in deleted_folders], *[('file', file_id) for file_id in deleted_files])
+        return deleted_folders, deleted_files
+
+    def cache_stats(self) -> CacheStats:
+        """
+        Returns the hit/miss counters and size of the FolderInfo/FileInfo cache.
+        """
+        return self.cache.stats()
+
+    def create_project(self, name: str, description: str =None):
+        with self._session_scope(write=True) as session:
             # Ensure that the name and description are strings
             if not isinstance(name, str):
                 raise ValueError("Project name must be a string.")
             if description is not None and not isinstance(description, str):
                 raise ValueError("Project description must be a string.")
-            
+
             # Ensure that a project with that name is not already present
             existing_project = session.query(Project).filter_by(name=name).first()
             if existing_project:
                 raise ValueError(f"Project with name '{name}' already exists.")
-            
+
             # Create the project and add it to the database
             new_project = Project(name=name, description=description)
             session.add(new_project)
             session.flush()
-            
+
             # Create the project's dummy folder
-            dummy_folder = Folder(name=name + " Root", project=new_project, parent=None)
+            dummy_folder = Folder(name=name + " Root", project=new_project, parent=None, path='/', depth=0)
             session.add(dummy_folder)
             session.flush()
-            
+
             new_project.root_folder_id = dummy_folder.id
-            session.commit()
-            
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
-            
-    def delete_project(self, identifier: int | str):
-        session = self.Session()
-        
-        try:
+            self._record(session, ChangeEvent(ChangeType.CREATED, 'project', new_project.id, name=name, description=description))
+
+    def delete_project(self, identifier: int | str) -> DeleteResult:
+        with self._session_scope(write=True) as session:
             # Find the project and delete it
             if isinstance(identifier, int):
-                project = session.query(Project).filter_by(id=identifier).one_or_none()
+                project = session.execute(select(Project.id, Project.name).where(Project.id == identifier)).one_or_none()
             elif isinstance(identifier, str):
-                project = session.query(Project).filter_by(name=identifier).one_or_none()
+                project = session.execute(select(Project.id, Project.name).where(Project.name == identifier)).one_or_none()
             else:
                 raise ValueError("Identifier must be an integer or string.")
-            
+
             if not project:
                 raise ValueError(f"Project: '{identifier}' does not exist.")
-            
-            session.delete(project)
-            session.commit()
-            
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
-            
+
+            # Delete every file and folder of the project, then the project itself
+            deleted_folders, deleted_files = self._delete_folders(session, Folder.project_id == project.id)
+            session.execute(delete(Project).where(Project.id == project.id).execution_options(synchronize_session='fetch'))
+            self._invalidate(session, ('project_root', project.id), ('project_root', project.name))
+            self._record(session, ChangeEvent(ChangeType.DELETED, 'project', project.id, name=project.name))
+
+            return DeleteResult(1, len(deleted_folders), len(deleted_files))
+
     def rename_project(self, identifier: int | str, new_name: str):
-        session = self.Session()
-        
-        try:
+        with self._session_scope(write=True) as session:
             # Find the project
             if isinstance(identifier, int):
                 project = session.query(Project).filter_by(id=identifier).one_or_none()
@@ -148,461 +735,1464 @@ class fileDatabase:
                 project = session.query(Project).filter_by(name=identifier).one_or_none()
             else:
                 raise ValueError("Identifier must be an integer or string.")
-            
+
             if not project:
                 raise ValueError(f"Project: '{identifier}' does not exist.")
-            
+
             # Ensure that a project with the new name is not already present
             existing_project = session.query(Project).filter_by(name=new_name).one_or_none()
             if existing_project:
                 raise ValueError(f"Project with name '{new_name}' already exists.")
-            
+
             if(normpath(new_name) == new_name):
+                self._invalidate(session, ('project_root', project.name))
                 project.name = new_name
-                session.commit()
-            
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
-            
+                session.flush()
+                self._record(session, ChangeEvent(ChangeType.RENAMED, 'project', project.id, name=new_name))
+
     def rename_folder(self, folder_id: int, new_name: str):
-        session = self.Session()
-        
-        try:
+        with self._session_scope(write=True) as session:
             # Find the folder
             if isinstance(folder_id, int):
-                folder = session.query(Folder).filter_by(id=folder).one_or_none()
+                folder = session.query(Folder).filter(Folder.id == folder_id, _LIVE_FOLDER).one_or_none()
             else:
                 raise ValueError("Identifier must be an integer.")
-            
+
             if not folder:
                 raise ValueError(f"Folder: '{folder_id}' does not exist.")
-            
+
             # Ensure that a folder with the new name is not already present
-            existing_folder = session.query(Folder).filter_by(name=new_name, parent_id=folder.parent_id).one_or_none()
+            existing_folder = session.query(Folder).filter_by(name=new_name, parent_id=folder.parent_id, deleted_at=None).first()
             if existing_folder:
                 raise ValueError(f"Folder with name '{new_name}' already exists in the parent folder.")
-            
+
             if(normpath(new_name) == new_name):
+                self._invalidate(session, ('folder', folder.id))
+                #a project's root folder is also cached under the project
+                if folder.parent_id is None:
+                    self._invalidate(session, ('project_root', folder.project_id), ('project_root', folder.project.name))
                 folder.name = new_name
-                session.commit()
-            
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
+                session.flush()
+                self._record(session, ChangeEvent(ChangeType.RENAMED, 'folder', folder.id, folder.parent_id, new_name))
 
-    def list_projects(self, max: int = None, skip: int = None) -> list[ProjectInfo]:
-        session = self.Session()
-        
-        try:
+    def list_projects(self, max: int = None, skip: int = None, sort_by: str = 'name', after: tuple = None) -> list[ProjectInfo]:
+        """
+        Lists projects ordered by sort_by, then id.
+
+        Pass the (sort value, id) of the last project of a page as after to get the next page
+        without the cost of skipping rows. skip still works, but grows slower with every page.
+        """
+        if sort_by not in _PROJECT_SORT_KEYS:
+            raise ValueError(f"Projects can only be sorted by {', '.join(_PROJECT_SORT_KEYS)}.")
+        sort_key = _PROJECT_SORT_KEYS[sort_by]
+
+        with self._session_scope() as session:
             # List all projects with their ids and names
-            query = session.query(Project.id, Project.name, Project.description, Project.status)
-            
+            query = select(Project.id, Project.name, Project.description, Project.status).order_by(sort_key, Project.id)
+
+            # Continue after the cursor
+            if after is not None:
+                query = query.where(tuple_(sort_key, Project.id) > tuple_(*after))
+
             # Apply pagination rules
             if max is not None:
                 query = query.limit(max)
             if skip is not None:
                 query = query.offset(skip)
-                
+
             # Execute the query
-            query = query.all()
-            return [ProjectInfo(*project) for project in query]
-            
-        except Exception as e:
-            raise e
-        finally:
-            session.close()
-    
+            return [ProjectInfo(*project) for project in _fetch_rows(session, query)]
+
+    def iter_projects(self, page_size: int = 500, sort_by: str = 'name') -> Iterator[list[ProjectInfo]]:
+        """
+        Yields every project, one keyset page at a time.
+        """
+        return _iterate_pages(
+            lambda cursor: (self.list_projects(max=page_size, sort_by=sort_by, after=cursor), page_size),
+            lambda project: (getattr(project, sort_by), project.id),
+        )
+
+    def list_projects_with_stats(self, max: int = None, sort_by: str = 'name', after: tuple = None) -> list[ProjectStats]:
+        """
+        Lists projects along with their file and folder counts, in one query.
+
+        The counts are the aggregates kept on each project's root folder, so a page costs the
+        same however many files the projects hold.
+
+        Args:
+            max (int): The maximum number of projects to return.
+            sort_by (str): 'name', 'status', 'files' or 'pending_files'. Ties are ordered by id.
+            after (tuple): The (sort value, id) of the last project of the previous page.
+
+        Returns:
+            list[ProjectStats]: The projects of the page.
+
+        Raises:
+            ValueError: If sort_by is not one of the supported orders.
+        """
+        if sort_by not in _PROJECT_STATS_SORT_KEYS:
+            raise ValueError(f"Projects can only be sorted by {', '.join(_PROJECT_STATS_SORT_KEYS)}.")
+        sort_key = _PROJECT_STATS_SORT_KEYS[sort_by]
+
+        with self._session_scope() as session:
+            statement = (
+                select(Project.id, Project.name, Project.description, Project.status,
+                       Folder.total_file_count, Folder.total_folder_count, Folder.summarized_file_count,
+                       Folder.total_file_count - Folder.summarized_file_count)
+                .join(Folder, Folder.id == Project.root_folder_id)
+                .order_by(sort_key, Project.id)
+            )
+
+            # Continue after the cursor
+            if after is not None:
+                statement = statement.where(tuple_(sort_key, Project.id) > tuple_(*after))
+            if max is not None:
+                statement = statement.limit(max)
+
+            return [ProjectStats(*project) for project in _fetch_rows(session, statement)]
+
+    def iter_projects_with_stats(self, page_size: int = 500, sort_by: str = 'name') -> Iterator[list[ProjectStats]]:
+        """
+        Yields every project with its counts, one keyset page at a time.
+        """
+        return _iterate_pages(
+            lambda cursor: (self.list_projects_with_stats(max=page_size, sort_by=sort_by, after=cursor), page_size),
+            lambda project: (getattr(project, sort_by), project.id),
+        )
+
+    def export_project(self, project_identifier: int | str, stream: TextIO) -> TransferResult:
+        """
+        Writes a project's folders and files to a text stream as newline-delimited JSON.
+
+        The first line describes the project, followed by one line per folder (parents before
+        their children) and one per file. Rows are read from the database in batches, so memory
+        use doesn't grow with the size of the project.
+
+        Args:
+            project_identifier (int | str): The id or name of the project.
+            stream (TextIO): Where to write, e.g. a file opened with open(path, 'w', encoding='utf-8').
+
+        Returns:
+            TransferResult: The project's id and how many folders and files were written.
+
+        Raises:
+            ValueError: If the project does not exist.
+        """
+        condition = _project_condition(project_identifier)
+
+        with self._session_scope() as session:
+            project = session.execute(select(Project.id, Project.name, Project.description, Project.status).where(condition)).one_or_none()
+
+            if not project:
+                raise ValueError(f"Project: '{project_identifier}' does not exist.")
+
+            stream.write(_json_line({'type': 'project', 'format': _EXPORT_FORMAT, 'name': project.name,
+                                     'description': project.description, 'status': project.status}))
+
+            # Stream the folders, parents first, then the files folder by folder
+            connection = session.connection()
+            folders = connection.execute(
+                select(Folder.id, Folder.parent_id, Folder.name)
+                .where(Folder.project_id == project.id, _LIVE_FOLDER)
+                .order_by(Folder.depth, Folder.id)
+                .execution_options(yield_per=_TRANSFER_BATCH)
+            )
+            folder_count = 0
+            for partition in folders.partitions():
+                stream.writelines(_json_line({'type': 'folder', 'id': folder_id, 'parent': parent_id, 'name': name})
+                                  for folder_id, parent_id, name in partition)
+                folder_count += len(partition)
+
+            files = connection.execute(
+                select(File.folder_id, File.name, File.URL, File.description)
+                .join(Folder, Folder.id == File.folder_id)
+                .where(Folder.project_id == project.id, File.deleted_at.is_(None), _IN_LIVE_FOLDER)
+                .order_by(File.folder_id, File.name, File.id)
+                .execution_options(yield_per=_TRANSFER_BATCH)
+            )
+            file_count = 0
+            for partition in files.partitions():
+                stream.writelines(_json_line({'type': 'file', 'folder': folder_id, 'name': name, 'URL': url, 'description': description})
+                                  for folder_id, name, url, description in partition)
+                file_count += len(partition)
+
+            return TransferResult(project.id, folder_count, file_count)
+
+    def import_project(self, stream: TextIO, name: str = None) -> TransferResult:
+        """
+        Recreates a project written by export_project, as a new project.
+
+        Everything is imported in one transaction with batched inserts. Folders get new ids
+        (shifted past the highest id in use), so only the folders, not the files, are held in
+        memory while the stream is read.
+
+        Args:
+            stream (TextIO): The export to read, e.g. a file opened with open(path, encoding='utf-8').
+            name (str): A name for the new project, if it shouldn't keep the exported one.
+
+        Returns:
+            TransferResult: The new project's id and how many folders and files were imported.
+
+        Raises:
+            ValueError: If the stream isn't a valid export, the project name is taken or a file's
+                URL already exists. Nothing is imported in that case.
+        """
+        lines = (line for line in stream if line.strip())
+        header = json.loads(next(lines, 'null'))
+        if not isinstance(header, dict) or header.get('type') != 'project':
+            raise ValueError("The stream does not start with a project export.")
+        if header.get('format') != _EXPORT_FORMAT:
+            raise ValueError(f"Unsupported export format: '{header.get('format')}'.")
+
+        # Read the folders, which come before the files
+        folder_records = []
+        first_file = None
+        for line in lines:
+            record = json.loads(line)
+            if record.get('type') != 'folder':
+                first_file = record
+                break
+            folder_records.append(record)
+
+        roots = [record for record in folder_records if record['parent'] is None]
+        if len(roots) != 1:
+            raise ValueError("The export must contain exactly one root folder.")
+
+        project_name = name if name is not None else header['name']
+
+        with self._session_scope(write=True) as session:
+            # Ensure that a project with that name is not already present
+            if session.scalar(select(Project.id).where(Project.name == project_name)) is not None:
+                raise ValueError(f"Project with name '{project_name}' already exists.")
+
+            project_values = {'name': project_name, 'description': header.get('description')}
+            if header.get('status') is not None:
+                project_values['status'] = header['status']
+            project_id = session.scalar(insert(Project.__table__).values(project_values).returning(Project.__table__.c.id))
+
+            #the write lock is held, so every shifted id stays free until the commit
+            offset = (session.scalar(select(func.max(Folder.id))) or 0) + 1 - min(record['id'] for record in folder_records)
+
+            # Insert the folders with their ancestry, parents first
+            parent_of = {}
+            paths = {}
+            rows = []
+            folders_table = Folder.__table__
+            for record in folder_records:
+                folder_id = record['id'] + offset
+                if record['parent'] is None:
+                    parent_id, path = None, '/'
+                    folder_name = record['name'] if name is None else name + " Root"
+                else:
+                    parent_id = record['parent'] + offset
+                    if parent_id not in paths:
+                        raise ValueError(f"Folder: '{record['id']}' comes before its parent folder.")
+                    path = _subtree_prefix(paths[parent_id], parent_id)
+                    folder_name = record['name']
+
+                parent_of[folder_id] = parent_id
+                paths[folder_id] = path
+                rows.append({'id': folder_id, 'name': folder_name, 'project_id': project_id, 'parent_id': parent_id,
+                             'path': path, 'depth': len(_ancestor_ids(path))})
+                if len(rows) == _TRANSFER_BATCH:
+                    session.execute(insert(folders_table), rows)
+                    rows = []
+            if rows:
+                session.execute(insert(folders_table), rows)
+
+            session.execute(update(Project.__table__).where(Project.__table__.c.id == project_id).values(root_folder_id=roots[0]['id'] + offset))
+            del paths
+
+            #index the new files with one statement at the end instead of row by row through the insert trigger
+            connection = session.connection()
+            if self.search_enabled:
+                last_file_id = session.scalar(select(func.max(File.id))) or 0
+                connection.exec_driver_sql("DROP TRIGGER files_fts_insert")
+
+            # Insert the files in batches, counting them per folder
+            file_counts = defaultdict(int)
+            summarized_counts = defaultdict(int)
+            file_count = 0
+            files_table = File.__table__
+
+            def insert_files(rows):
+                urls = [row['URL'] for row in rows]
+                if len(set(urls)) != len(urls):
+                    raise ValueError("A file URL is listed twice in the export.")
+                _claim_urls(session, urls)
+                session.execute(insert(files_table), rows)
+
+            rows = []
+            file_records = () if first_file is None else itertools.chain([first_file], map(json.loads, lines))
+            for record in file_records:
+                if record.get('type') != 'file':
+                    raise ValueError(f"Unexpected '{record.get('type')}' record among the files.")
+                folder_id = record['folder'] + offset
+                if folder_id not in parent_of:
+                    raise ValueError(f"Folder: '{record['folder']}' does not exist in the export.")
+
+                rows.append({'name': record['name'], 'folder_id': folder_id, 'URL': record['URL'], 'description': record.get('description')})
+                file_counts[folder_id] += 1
+                summarized_counts[folder_id] += _is_summarized(record.get('description'))
+                if len(rows) == _TRANSFER_BATCH:
+                    insert_files(rows)
+                    file_count += len(rows)
+                    rows = []
+            if rows:
+                insert_files(rows)
+                file_count += len(rows)
+
+            if self.search_enabled:
+                connection.exec_driver_sql(
+                    "INSERT INTO files_fts(rowid, name, description) SELECT id, name, description FROM files WHERE id > ?", (last_file_id,))
+                connection.exec_driver_sql(_SEARCH_INSERT_TRIGGER)
+
+            # Fill in the counters, from the deepest folders up
+            totals = {folder_id: [file_counts[folder_id], 0, summarized_counts[folder_id], 0] for folder_id in parent_of}
+            for folder_id in reversed(list(parent_of)):
+                parent_id = parent_of[folder_id]
+                if parent_id is not None:
+                    total, parent_total = totals[folder_id], totals[parent_id]
+                    parent_total[0] += total[0]
+                    parent_total[1] += total[1] + 1
+                    parent_total[2] += total[2]
+                    parent_total[3] += 1
+
+            session.execute(
+                update(folders_table).where(folders_table.c.id == bindparam('folder_id')).values(
+                    file_count=bindparam('new_file_count'), folder_count=bindparam('new_folder_count'),
+                    total_file_count=bindparam('new_total_file_count'), total_folder_count=bindparam('new_total_folder_count'),
+                    summarized_file_count=bindparam('new_summarized_file_count')),
+                [{'folder_id': folder_id, 'new_file_count': file_counts[folder_id], 'new_folder_count': total[3],
+                  'new_total_file_count': total[0], 'new_total_folder_count': total[1], 'new_summarized_file_count': total[2]}
+                 for folder_id, total in totals.items()]
+            )
+
+            #one event for the whole project rather than one per imported row
+            self._record(session, ChangeEvent(ChangeType.CREATED, 'project', project_id, name=project_name, description=header.get('description')))
+
+            return TransferResult(project_id, len(parent_of), file_count)
+
     def get_project_root(self, project_identifier: int | str):
-        session = self.Session()
-        
-        try:
-            #find the project's id if the name was passed
+        cached = self.cache.get(('project_root', project_identifier))
+        if cached is not None:
+            return cached
+
+        token = self.cache.read_token()
+        with self._session_scope() as session:
+            #find the project by name or id
             if(isinstance(project_identifier, str)):
-                project = session.query(Project).filter_by(name=project_identifier).one_or_none()
+                condition = Project.name == project_identifier
             elif(isinstance(project_identifier, int)):
-                project = session.query(Project).filter_by(id=project_identifier).one_or_none()
+                condition = Project.id == project_identifier
             else:
                 raise ValueError("Identifier must be an integer or string.")
-            
-            if not project:
+
+            root_folder = session.execute(
+                select(Folder.id, Folder.name).join(Project, Project.root_folder_id == Folder.id).where(condition)
+            ).one_or_none()
+
+            if not root_folder:
                 raise ValueError(f"Project: '{project_identifier}' does not exist.")
-            
-            root_folder = session.query(Folder).filter_by(id=project.root_folder_id).one()
-            return FolderInfo(root_folder.id, root_folder.name)
-            
-        except Exception as e:
-            raise e
-        finally:
-            session.close()
+
+            root_info = FolderInfo(*root_folder)
+
+        self._cache_put(('project_root', project_identifier), root_info, token)
+        return root_info
 
     def create_folder(self, name: str, parent_id: int):
-        session = self.Session()
-        
-        try:
+        with self._session_scope(write=True) as session:
             if(not normpath('(path-to-wiki)/foo/bar.txt').startswith('(path-to-wiki)')):
                 return
-            
+
             # Ensure that the parent folder exists
             if parent_id:
-                parent_folder = session.query(Folder).filter_by(id=parent_id).one_or_none()
+                parent_folder = session.query(Folder).filter(Folder.id == parent_id, _LIVE_FOLDER).one_or_none()
                 if not parent_folder:
                     raise ValueError(f"Parent folder: '{parent_id}' does not exist.")
             else:
                 raise ValueError("Parent folder ID must be provided.")
-            
+
             # Ensure that a folder with that name is not already present in the parent_folder
-            if session.query(Folder).filter_by(name=name, parent_id=parent_id).first():
+            if session.query(Folder).filter_by(name=name, parent_id=parent_id, deleted_at=None).first():
                 raise ValueError(f"Folder with name '{name}' already exists in the project.")
-            
+
             #get the project
             project = parent_folder.project
-            
+
             # Create the folder and add it to the database
-            new_folder = Folder(name=name, project=project, parent=parent_folder)
+            new_folder = Folder(name=name, project=project, parent=parent_folder,
+                                path=_subtree_prefix(parent_folder.path, parent_folder.id), depth=parent_folder.depth + 1)
             session.add(new_folder)
-            session.commit()
-            
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
-    
-    
-    def get_child_folders(self, identifier: int | str, parent_folder: int = None, max: int = None, skip: int = None):
-        session = self.Session()
-        
-        try:
+            session.flush()
+
+            changes = _StatChanges()
+            changes.add(parent_folder.id, parent_folder.path, folders=1, total_folders=1)
+            changes.apply(session)
+
+            self._record(session, ChangeEvent(ChangeType.CREATED, 'folder', new_folder.id, parent_id, name))
+
+
+    def create_folders_bulk(self, folders: list[tuple[str, int]]) -> list[int]:
+        """
+        Creates many folders in one transaction.
+
+        The whole batch is validated with set-based queries before anything is inserted, so
+        either every folder is created or none are.
+
+        Args:
+            folders (list[tuple[str, int]]): (name, parent_id) pairs. Parents must already exist.
+
+        Returns:
+            list[int]: The IDs of the new folders, in input order.
+
+        Raises:
+            ValueError: If a parent is missing or a name collides with a sibling or another entry.
+        """
+        folders = list(folders)
+        if not folders:
+            return []
+
+        with self._session_scope(write=True) as session:
+            # Ensure that the parent folders exist
+            parent_ids = list({parent_id for _, parent_id in folders})
+            parents = {}
+            for chunk in _chunked(parent_ids):
+                for parent in session.execute(select(Folder.id, Folder.project_id, Folder.path, Folder.depth).where(Folder.id.in_(chunk), _LIVE_FOLDER)):
+                    parents[parent.id] = parent
+
+            for name, parent_id in folders:
+                if parent_id not in parents:
+                    raise ValueError(f"Parent folder: '{parent_id}' does not exist.")
+
+            # Ensure that no two entries collide with each other or with folders already in the parents
+            requested = set()
+            for name, parent_id in folders:
+                if (parent_id, name) in requested:
+                    raise ValueError(f"Folder with name '{name}' is listed twice for parent folder '{parent_id}'.")
+                requested.add((parent_id, name))
+
+            for chunk in _chunked(list(requested), _MAX_IN_PARAMS // 2):
+                existing = session.execute(
+                    select(Folder.parent_id, Folder.name).where(tuple_(Folder.parent_id, Folder.name).in_(chunk), Folder.deleted_at.is_(None))
+                ).first()
+                if existing:
+                    raise ValueError(f"Folder with name '{existing.name}' already exists in the project.")
+
+            # Insert every folder with one executemany
+            rows = [{'name': name, 'parent_id': parent_id, 'project_id': parents[parent_id].project_id,
+                     'path': _subtree_prefix(parents[parent_id].path, parent_id), 'depth': parents[parent_id].depth + 1}
+                    for name, parent_id in folders]
+            #(parent_id, name) is unique within the batch, so it maps the returned ids back to input order (Core insert, see add_files_bulk)
+            folders_table = Folder.__table__
+            statement = insert(folders_table).returning(folders_table.c.id, folders_table.c.parent_id, folders_table.c.name)
+            new_ids = {(row.parent_id, row.name): row.id for row in session.execute(statement, rows)}
+
+            changes = _StatChanges()
+            for name, parent_id in folders:
+                changes.add(parent_id, parents[parent_id].path, folders=1, total_folders=1)
+            changes.apply(session)
+
+            self._record(session, *[ChangeEvent(ChangeType.CREATED, 'folder', new_ids[(parent_id, name)], parent_id, name) for name, parent_id in folders])
+
+            return [new_ids[(parent_id, name)] for name, parent_id in folders]
+
+    def get_child_folders(self, identifier: int | str, parent_folder: int = None, max: int = None, skip: int = None, after: tuple[str, int] = None,
+                          columnar: bool = False) -> list[FolderInfo] | FolderColumns:
+        """
+        Lists a folder's subfolders by name.
+
+        Pass columnar=True to get a FolderColumns of parallel lists instead of one FolderInfo per
+        subfolder, which is cheaper for very large folders.
+        """
+        with self._session_scope() as session:
             #find the folder if the name was passed instead of ID
             if(isinstance(identifier, str)):
                 if(isinstance(parent_folder, int)):
-                    folder = session.query(Folder).filter_by(name=identifier, id=parent_folder).one_or_none()
+                    folder_id = session.scalar(select(Folder.id).where(Folder.name == identifier, Folder.id == parent_folder, _LIVE_FOLDER))
                 else:
                     raise ValueError("Parent folder must be specified when searching for a folder by name.")
             elif(isinstance(identifier, int)):
-                folder = session.query(Folder).filter_by(id=identifier).one_or_none()
+                folder_id = session.scalar(select(Folder.id).where(Folder.id == identifier, _LIVE_FOLDER))
             else:
                 raise ValueError("Identifier must be an integer or string.")
-                
-            if not folder:
+
+            if folder_id is None:
                 raise ValueError(f"Folder: '{identifier}' does not exist.")
-            
-            children = session.query(Folder).filter_by(parent_id=folder.id)
-            
+
+            children = select(Folder.id, Folder.name).where(Folder.parent_id == folder_id, Folder.deleted_at.is_(None)).order_by(_FOLDER_NAME_ORDER, Folder.id)
+
+            #continue after the (name, id) cursor
+            if(after is not None):
+                children = children.where(tuple_(_FOLDER_NAME_ORDER, Folder.id) > tuple_(*after))
+
             if(max is not None):
                 children = children.limit(max)
             if(skip is not None):
                 children = children.offset(skip)
-                
-            
-            return [FolderInfo(child.id, child.name) for child in children.all()]
-            
-        except Exception as e:
-            raise e
-        finally:
-            session.close()
+
+            rows = _fetch_rows(session, children)
+            if columnar:
+                return _as_columns(FolderColumns, rows)
+            return [FolderInfo(*child) for child in rows]
+
+    def iter_child_folders(self, folder_id: int, page_size: int = 500) -> Iterator[list[FolderInfo]]:
+        """
+        Yields a folder's subfolders by name, one keyset page at a time.
+        """
+        return _iterate_pages(
+            lambda cursor: (self.get_child_folders(folder_id, max=page_size, after=cursor), page_size),
+            lambda folder: (folder.name, folder.id),
+        )
+
+    def list_folder_contents(self, folder_id: int, sort: str = 'name', limit: int = None, after: FolderInfo | FileInfo = None) -> list[FolderInfo | FileInfo]:
+        """
+        Lists a folder's subfolders and files together with a single UNION query.
+
+        Args:
+            folder_id (int): The folder to list.
+            sort (str): 'name' to interleave folders and files by name, or 'type' for folders first.
+            limit (int): The maximum number of items to return.
+            after (FolderInfo | FileInfo): The last item of the previous page, to continue from it.
+
+        Returns:
+            list[FolderInfo | FileInfo]: The folder's children, in the requested order.
+        """
+        if sort not in _CONTENTS_SORT_KEYS:
+            raise ValueError(f"Folder contents can only be sorted by {', '.join(_CONTENTS_SORT_KEYS)}.")
+
+        with self._session_scope() as session:
+            #a removed folder lists nothing; the check doesn't depend on the row, so SQLite runs it once
+            folder_is_live = exists().where(_listed.id == folder_id, _LIVE_LISTED)
+            contents = union_all(
+                select(literal(0).label('kind'), Folder.id, Folder.name, null().label('URL'), null().label('description'))
+                .where(Folder.parent_id == folder_id, Folder.deleted_at.is_(None), folder_is_live),
+                select(literal(1).label('kind'), File.id, File.name, File.URL, File.description)
+                .where(File.folder_id == folder_id, File.deleted_at.is_(None), folder_is_live),
+            ).subquery()
+
+            sort_columns = [contents.c.name.collate('NOCASE') if key == 'name' else contents.c[key] for key in _CONTENTS_SORT_KEYS[sort]]
+            query = select(contents).order_by(*sort_columns)
+
+            #continue after the last item of the previous page
+            if after is not None:
+                cursor = {'kind': 0 if isinstance(after, FolderInfo) else 1, 'name': after.name, 'id': after.id}
+                query = query.where(tuple_(*sort_columns) > tuple_(*[cursor[key] for key in _CONTENTS_SORT_KEYS[sort]]))
+
+            if limit is not None:
+                query = query.limit(limit)
+
+            rows = _fetch_rows(session, query)
+
+            #only an empty listing needs to tell an empty folder from a missing one
+            if not rows and session.scalar(select(Folder.id).where(Folder.id == folder_id, _LIVE_FOLDER)) is None:
+                raise ValueError(f"Folder: '{folder_id}' does not exist.")
+
+            return [FolderInfo(row.id, row.name) if row.kind == 0 else FileInfo(row.id, row.name, row.URL, row.description) for row in rows]
+
+    def iter_folder_contents(self, folder_id: int, sort: str = 'name', page_size: int = 500) -> Iterator[list[FolderInfo | FileInfo]]:
+        """
+        Yields a folder's subfolders and files, one keyset page at a time.
+        """
+        return _iterate_pages(
+            lambda cursor: (self.list_folder_contents(folder_id, sort=sort, limit=page_size, after=cursor), page_size),
+            lambda item: item,
+        )
 
     def get_folder_parent(self, folder_id: int):
-        session = self.Session()
-        
-        try:                
-            folder = session.query(Folder).filter_by(id=folder_id).one_or_none()
-            
+        with self._session_scope() as session:
+            parent = aliased(Folder)
+            folder = session.execute(
+                select(Folder.id, parent.id.label('parent_id'), parent.name.label('parent_name'))
+                .outerjoin(parent, parent.id == Folder.parent_id)
+                .where(Folder.id == folder_id, _LIVE_FOLDER)
+            ).one_or_none()
+
             if not folder:
                 raise ValueError(f"Folder: '{folder_id}' does not exist.")
-            
+
             #folder is the root folder
             if(folder.parent_id is None):
                 return None
-        
-            parent_folder = session.query(Folder).filter_by(id=folder.parent_id).one_or_none()
-            
-            return FolderInfo(parent_folder.id, parent_folder.name)
-            
-        except Exception as e:
-            raise e
-        finally:
-            session.close()
-            
+
+            return FolderInfo(folder.parent_id, folder.parent_name)
+
     def add_file(self, name: str, folder_id: int, url: str, description: str):
-        session = self.Session()
-        
-        try:
+        with self._session_scope(write=True) as session:
             # Ensure that the folder exists
-            folder = session.query(Folder).filter_by(id=folder_id).one_or_none()
+            folder = session.query(Folder).filter(Folder.id == folder_id, _LIVE_FOLDER).one_or_none()
             if not folder:
                 raise ValueError(f"Folder: '{folder_id}' does not exist.")
-            
+
             # Ensure that a file with that name is not already present in the folder
-            if session.query(File).filter_by(name=name, folder_id=folder_id).first():
+            if session.query(File).filter_by(name=name, folder_id=folder_id, deleted_at=None).first():
                 raise ValueError(f"File with name '{name}' already exists in the folder.")
-            
+
             #ensure that no files with this url already exist
-            if session.query(File).filter_by(URL=url).first():
-                raise ValueError(f"File with URL '{url}' already exists.")
-            
+            _claim_urls(session, [url])
+
             # Create the file and add it to the database
             new_file = File(name=name, folder=folder, URL=url, description=description)
             session.add(new_file)
-            session.commit()
-            
+            session.flush()
+
+            changes = _StatChanges()
+            changes.add(folder.id, folder.path, files=1, total_files=1, summarized=int(_is_summarized(description)))
+            changes.apply(session)
+
+            self._record(session, ChangeEvent(ChangeType.CREATED, 'file', new_file.id, folder_id, name, description))
+
             return new_file.id
-            
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
-            
-    def get_child_files(self, folder_id: int, max: int = None, skip: int = None):
-        session = self.Session()
-        
-        try:
+
+    def add_files_bulk(self, files: list[tuple[str, int, str, str]]) -> list[int]:
+        """
+        Adds many files in one transaction.
+
+        The whole batch is validated with set-based queries before anything is inserted, so
+        either every file is added or none are.
+
+        Args:
+            files (list[tuple[str, int, str, str]]): (name, folder_id, url, description) tuples,
+                in the same order as the arguments of add_file.
+
+        Returns:
+            list[int]: The IDs of the new files, in input order.
+
+        Raises:
+            ValueError: If a folder is missing, a name collides within a folder, or a URL is already used.
+        """
+        files = list(files)
+        if not files:
+            return []
+
+        with self._session_scope(write=True) as session:
+            # Ensure that the folders exist
+            folder_ids = list({folder_id for _, folder_id, _, _ in files})
+            existing_folders = {}
+            for chunk in _chunked(folder_ids):
+                existing_folders.update(session.execute(select(Folder.id, Folder.path).where(Folder.id.in_(chunk), _LIVE_FOLDER)).all())
+
+            for name, folder_id, url, description in files:
+                if folder_id not in existing_folders:
+                    raise ValueError(f"Folder: '{folder_id}' does not exist.")
+
+            # Ensure that names and URLs are unique within the batch
+            requested_names = set()
+            requested_urls = set()
+            for name, folder_id, url, description in files:
+                if (folder_id, name) in requested_names:
+                    raise ValueError(f"File with name '{name}' is listed twice for folder '{folder_id}'.")
+                if url in requested_urls:
+                    raise ValueError(f"File with URL '{url}' is listed twice.")
+                requested_names.add((folder_id, name))
+                requested_urls.add(url)
+
+            # Ensure that they don't collide with files already in the database
+            for chunk in _chunked(list(requested_names), _MAX_IN_PARAMS // 2):
+                existing = session.execute(
+                    select(File.folder_id, File.name).where(tuple_(File.folder_id, File.name).in_(chunk), File.deleted_at.is_(None))
+                ).first()
+                if existing:
+                    raise ValueError(f"File with name '{existing.name}' already exists in the folder.")
+
+            _claim_urls(session, list(requested_urls))
+
+            # Insert every file with one executemany
+            rows = [{'name': name, 'folder_id': folder_id, 'URL': url, 'description': description} for name, folder_id, url, description in files]
+            #URLs are unique, so they map the returned ids back to input order (Core insert: the ORM splits rows with NULLs into separate statements)
+            files_table = File.__table__
+            new_ids = dict(session.execute(insert(files_table).returning(files_table.c.URL, files_table.c.id), rows).all())
+
+            changes = _StatChanges()
+            for name, folder_id, url, description in files:
+                changes.add(folder_id, existing_folders[folder_id], files=1, total_files=1, summarized=int(_is_summarized(description)))
+            changes.apply(session)
+
+            self._record(session, *[ChangeEvent(ChangeType.CREATED, 'file', new_ids[url], folder_id, name, description)
+                                    for name, folder_id, url, description in files])
+
+            return [new_ids[url] for name, folder_id, url, description in files]
+
+    def get_child_files(self, folder_id: int, max: int = None, skip: int = None, after: tuple[str, int] = None,
+                        columnar: bool = False) -> list[FileInfo] | FileColumns:
+        """
+        Lists a folder's files by name.
+
+        Pass columnar=True to get a FileColumns of parallel lists instead of one FileInfo per
+        file, which is cheaper for very large folders.
+        """
+        with self._session_scope() as session:
             #find the folder
-            folder = session.query(Folder).filter_by(id=folder_id).one_or_none()
-            
-            if not folder:
+            if session.scalar(select(Folder.id).where(Folder.id == folder_id, _LIVE_FOLDER)) is None:
                 raise ValueError(f"Folder: '{folder_id}' does not exist.")
-            
-            query = session.query(File).filter_by(folder_id=folder_id)
-            
+
+            query = select(File.id, File.name, File.URL, File.description).where(File.folder_id == folder_id, File.deleted_at.is_(None)).order_by(_FILE_NAME_ORDER, File.id)
+
+            #continue after the (name, id) cursor
+            if after is not None:
+                query = query.where(tuple_(_FILE_NAME_ORDER, File.id) > tuple_(*after))
+
             if max is not None:
                 query = query.limit(max)
             if skip is not None:
                 query = query.offset(skip)
-                
-            return [FileInfo(file.id, file.name, file.URL, file.description) for file in query.all()]
-            
-        except Exception as e:
-            raise e
-        finally:
-            session.close()
+
+            rows = _fetch_rows(session, query)
+            if columnar:
+                return _as_columns(FileColumns, rows)
+            return [FileInfo(*file) for file in rows]
+
+    def iter_child_files(self, folder_id: int, page_size: int = 500) -> Iterator[list[FileInfo]]:
+        """
+        Yields a folder's files by name, one keyset page at a time.
+        """
+        return _iterate_pages(
+            lambda cursor: (self.get_child_files(folder_id, max=page_size, after=cursor), page_size),
+            lambda file: (file.name, file.id),
+        )
 
     def get_file_parent(self, file_id: int):
-        session = self.Session()
-        
-        try:
-            file = session.query(File).filter_by(id=file_id).one_or_none()
-            
-            if not file:
+        with self._session_scope() as session:
+            folder = session.execute(
+                select(Folder.id, Folder.name).join(File, File.folder_id == Folder.id).where(File.id == file_id, _LIVE_FILE)
+            ).one_or_none()
+
+            if not folder:
                 raise ValueError(f"File: '{file_id}' does not exist.")
-            
-            folder = session.query(Folder).filter_by(id=file.folder_id).one_or_none()
-            
-            return FolderInfo(folder.id, folder.name)
-            
-        except Exception as e:
-            raise e
-        finally:
-            session.close()
-            
+
+            return FolderInfo(*folder)
+
     def get_file_project(self, file_id: int):
-        session = self.Session()
-        
-        try:
-            file = session.query(File).filter_by(id=file_id).one_or_none()
-            
-            if not file:
+        with self._session_scope() as session:
+            project = session.execute(
+                select(Project.id, Project.name, Project.description, Project.status)
+                .join(Folder, Folder.project_id == Project.id)
+                .join(File, File.folder_id == Folder.id)
+                .where(File.id == file_id, _LIVE_FILE)
+            ).one_or_none()
+
+            if not project:
                 raise ValueError(f"File: '{file_id}' does not exist.")
-            
-            folder = session.query(Folder).filter_by(id=file.folder_id).one_or_none()
-            project = session.query(Project).filter_by(id=folder.project_id).one_or_none()
-            
-            return ProjectInfo(project.id, project.name, project.description, project.status)
-            
-        except Exception as e:
-            raise e
-        finally:
-            session.close()
-        
+
+            return ProjectInfo(*project)
+
     def get_folder_project(self, folder_id: int):
-        session = self.Session()
-        
-        try:
-            folder = session.query(Folder).filter_by(id=folder_id).one_or_none()
-            
-            if not folder:
+        with self._session_scope() as session:
+            project = session.execute(
+                select(Project.id, Project.name, Project.description, Project.status)
+                .join(Folder, Folder.project_id == Project.id)
+                .where(Folder.id == folder_id, _LIVE_FOLDER)
+            ).one_or_none()
+
+            if not project:
                 raise ValueError(f"Folder: '{folder_id}' does not exist.")
-            
-            project = session.query(Project).filter_by(id=folder.project_id).one_or_none()
-            
-            return ProjectInfo(project.id, project.name, project.description, project.status)
-            
-        except Exception as e:
-            raise e
-        finally:
-            session.close()
-            
+
+            return ProjectInfo(*project)
+
     def get_folder(self, folder_id: int):
-        session = self.Session()
-        
-        try:
-            folder = session.query(Folder).filter_by(id=folder_id).one_or_none()
-            
+        cached = self.cache.get(('folder', folder_id))
+        #a folder removed or moved above the cached one since it was read may have hidden it
+        if cached is not None and self._ancestry_changes.unchanged_since(cached[2], cached[1]):
+            return cached[0]
+
+        token = self.cache.read_token()
+        epoch = self._ancestry_changes.epoch
+        with self._session_scope() as session:
+            folder = session.execute(select(Folder.id, Folder.name, Folder.path).where(Folder.id == folder_id, _LIVE_FOLDER)).one_or_none()
+
             if not folder:
                 raise ValueError(f"Folder: '{folder_id}' does not exist.")
-            
-            return FolderInfo(folder.id, folder.name)
-            
-        except Exception as e:
-            raise e
-        finally:
-            session.close()
-            
-    def remove_folder(self, folder_id: int):
-        session = self.Session()
-        
-        try:
-            folder = session.query(Folder).filter_by(id=folder_id).one_or_none()
-            
+
+            folder_info = FolderInfo(folder.id, folder.name)
+
+        self._cache_put(('folder', folder_id), (folder_info, tuple(_ancestor_ids(folder.path)), epoch), token)
+        return folder_info
+
+    def get_folder_ancestors(self, folder_id: int) -> list[FolderInfo]:
+        """
+        Returns every ancestor of a folder, from the project root down to its parent.
+        """
+        with self._session_scope() as session:
+            path = session.scalars(select(Folder.path).where(Folder.id == folder_id, _LIVE_FOLDER)).one_or_none()
+
+            if path is None:
+                raise ValueError(f"Folder: '{folder_id}' does not exist.")
+
+            ancestors = _fetch_rows(session, select(Folder.id, Folder.name).where(Folder.id.in_(_ancestor_ids(path))).order_by(Folder.depth))
+            return [FolderInfo(*ancestor) for ancestor in ancestors]
+
+    def get_folder_path(self, folder_id: int) -> list[FolderInfo]:
+        """
+        Returns the folders from the project root down to (and including) a folder, for breadcrumbs.
+
+        The chain is resolved with a single recursive query along parent_id.
+        """
+        with self._session_scope() as session:
+            lineage = (select(Folder.id, Folder.name, Folder.parent_id, literal(0).label('level'))
+                       .where(Folder.id == folder_id, _LIVE_FOLDER).cte('lineage', recursive=True))
+            parent = aliased(Folder)
+            lineage = lineage.union_all(
+                select(parent.id, parent.name, parent.parent_id, lineage.c.level + 1).join(lineage, parent.id == lineage.c.parent_id)
+            )
+
+            folders = _fetch_rows(session, select(lineage.c.id, lineage.c.name).order_by(lineage.c.level.desc()))
+
+            if not folders:
+                raise ValueError(f"Folder: '{folder_id}' does not exist.")
+
+            return [FolderInfo(*folder) for folder in folders]
+
+    def get_folder_descendants(self, folder_id: int) -> list[FolderInfo]:
+        """
+        Returns every folder below a folder at any depth, parents before their children.
+        """
+        with self._session_scope() as session:
+            folder = session.execute(select(Folder.id, Folder.path).where(Folder.id == folder_id, _LIVE_FOLDER)).one_or_none()
+
             if not folder:
                 raise ValueError(f"Folder: '{folder_id}' does not exist.")
-            
+
+            descendants = _fetch_rows(
+                session,
+                select(Folder.id, Folder.name).where(_within_subtree(_subtree_prefix(folder.path, folder.id)), _LIVE_FOLDER).order_by(Folder.path, Folder.id)
+            )
+            return [FolderInfo(*descendant) for descendant in descendants]
+
+    def get_folder_depth(self, folder_id: int) -> int:
+        """
+        Returns how many folders sit above a folder (0 for a project's root folder).
+        """
+        with self._session_scope() as session:
+            depth = session.scalars(select(Folder.depth).where(Folder.id == folder_id, _LIVE_FOLDER)).one_or_none()
+
+            if depth is None:
+                raise ValueError(f"Folder: '{folder_id}' does not exist.")
+
+            return depth
+
+    def get_folder_stats(self, folder_id: int) -> FolderStats:
+        """
+        Returns a folder's file and subfolder counts, read from its own row.
+
+        Args:
+            folder_id (int): The folder to describe.
+
+        Returns:
+            FolderStats: Its direct and subtree counts, and how many files are summarized or pending.
+
+        Raises:
+            ValueError: If the folder does not exist.
+        """
+        with self._session_scope() as session:
+            row = session.execute(select(*(getattr(Folder, name) for name in _STAT_COLUMNS)).where(Folder.id == folder_id, _LIVE_FOLDER)).one_or_none()
+
+            if not row:
+                raise ValueError(f"Folder: '{folder_id}' does not exist.")
+
+            return _folder_stats(row)
+
+    def get_folders_stats(self, folder_ids: list[int]) -> dict[int, FolderStats]:
+        """
+        Returns the counts of many folders at once, e.g. for a page of a listing.
+
+        Args:
+            folder_ids (list[int]): The folders to describe. Missing folders are left out of the result.
+
+        Returns:
+            dict[int, FolderStats]: The counts of each folder, by id.
+        """
+        stats = {}
+        with self._session_scope() as session:
+            for chunk in _chunked(list(dict.fromkeys(folder_ids))):
+                for row in _fetch_rows(session, select(Folder.id, *(getattr(Folder, name) for name in _STAT_COLUMNS)).where(Folder.id.in_(chunk), _LIVE_FOLDER)):
+                    stats[row.id] = _folder_stats(row)
+
+        return stats
+
+    def get_project_stats(self, project_identifier: int | str) -> FolderStats:
+        """
+        Returns the counts of a whole project, which are those of its root folder.
+
+        Raises:
+            ValueError: If the project does not exist.
+        """
+        if isinstance(project_identifier, int):
+            condition = Project.id == project_identifier
+        elif isinstance(project_identifier, str):
+            condition = Project.name == project_identifier
+        else:
+            raise ValueError("Identifier must be an integer or string.")
+
+        with self._session_scope() as session:
+            row = session.execute(
+                select(*(getattr(Folder, name) for name in _STAT_COLUMNS)).join(Project, Project.root_folder_id == Folder.id).where(condition)
+            ).one_or_none()
+
+            if not row:
+                raise ValueError(f"Project: '{project_identifier}' does not exist.")
+
+            return _folder_stats(row)
+
+    def rebuild_folder_stats(self):
+        """
+        Recounts every folder's counters from the files and folders tables.
+
+        The mutators keep the counters current on their own; this is only needed to repair a
+        database that was changed behind fileDatabase's back.
+        """
+        with self._session_scope(write=True) as session:
+            session.connection().exec_driver_sql(REBUILD_FOLDER_STATS_SQL)
+
+    def remove_folder(self, folder_id: int) -> DeleteResult:
+        """
+        Removes a folder and everything inside it.
+
+        Only the folder itself gets a tombstone, so this takes the same time for any subtree:
+        reads stop seeing the subtree right away, and purge_deleted deletes the rows later.
+        Until then restore_folder can bring it back.
+
+        Returns:
+            DeleteResult: How many folders and files were removed along with the folder.
+
+        Raises:
+            ValueError: If the folder does not exist.
+        """
+        with self._session_scope(write=True) as session:
+            folder = session.execute(
+                select(Folder.id, Folder.name, Folder.parent_id, Folder.path, Folder.total_file_count, Folder.total_folder_count, Folder.summarized_file_count)
+                .where(Folder.id == folder_id, _LIVE_FOLDER)
+            ).one_or_none()
+
+            if not folder:
+                raise ValueError(f"Folder: '{folder_id}' does not exist.")
+
             # Don't delete the root folder
-            if folder.parent_id is not None:
-                # Delete the folder and all its children
-                session.delete(folder)
-                session.commit()
-            
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
-            
+            if folder.parent_id is None:
+                return DeleteResult(0, 0, 0)
+
+            # Tombstone the folder; everything below it is hidden through its ancestry
+            session.execute(update(Folder).where(Folder.id == folder.id).values(deleted_at=time.time()).execution_options(synchronize_session=False))
+            self._invalidate(session, ('folder', folder.id))
+            self._invalidate_below(session, folder.id)
+
+            # Take the subtree out of the counters of the folders above it
+            changes = _StatChanges()
+            changes.add(folder.parent_id, _parent_path(folder.path), folders=-1, total_files=-folder.total_file_count,
+                        total_folders=-(folder.total_folder_count + 1), summarized=-folder.summarized_file_count)
+            changes.apply(session)
+
+            self._record(session, ChangeEvent(ChangeType.DELETED, 'folder', folder.id, folder.parent_id, folder.name))
+
+            return DeleteResult(0, folder.total_folder_count + 1, folder.total_file_count)
+
     def remove_file(self, file_id: int):
-        session = self.Session()
-        
-        try:
-            file = session.query(File).filter_by(id=file_id).one_or_none()
-            
+        with self._session_scope(write=True) as session:
+            file = session.execute(
+                select(File.id, File.name, File.folder_id, File.description, Folder.path).join(Folder, Folder.id == File.folder_id).where(File.id == file_id, _LIVE_FILE)
+            ).one_or_none()
+
             if not file:
                 raise ValueError(f"File: '{file_id}' does not exist.")
-            
-            # Delete the file
-            session.delete(file)
-            session.commit()
-            
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
-            
-    def move_file(self, file_id: int, new_folder_id: int):
-        session = self.Session()
-        
-        try:
-            file = session.query(File).filter_by(id=file_id).one_or_none()
-            
+
+            # Tombstone the file; purge_deleted deletes it later
+            self._invalidate(session, ('file', file.id))
+            session.execute(update(File).where(File.id == file.id).values(deleted_at=time.time()).execution_options(synchronize_session=False))
+
+            changes = _StatChanges()
+            changes.add(file.folder_id, file.path, files=-1, total_files=-1, summarized=-int(_is_summarized(file.description)))
+            changes.apply(session)
+
+            self._record(session, ChangeEvent(ChangeType.DELETED, 'file', file.id, file.folder_id, file.name))
+
+    def restore_folder(self, folder_id: int):
+        """
+        Brings back a folder removed by remove_folder, with everything that was inside it.
+
+        Args:
+            folder_id (int): The removed folder. Restoring a folder that isn't removed does nothing.
+
+        Raises:
+            ValueError: If the folder was already purged, its parent is removed too, or a folder
+                with the same name was created in the parent meanwhile.
+        """
+        with self._session_scope(write=True) as session:
+            folder = session.execute(select(Folder.id, Folder.name, Folder.parent_id, Folder.path, Folder.deleted_at).where(Folder.id == folder_id)).one_or_none()
+
+            if not folder:
+                raise ValueError(f"Folder: '{folder_id}' does not exist.")
+            if folder.deleted_at is None:
+                return
+
+            # Ensure that the parent is live and has no new folder with that name
+            if session.scalar(select(Folder.id).where(Folder.id == folder.parent_id, _LIVE_FOLDER)) is None:
+                raise ValueError(f"Folder: '{folder_id}' is inside a removed folder.")
+            if session.scalar(select(Folder.id).where(Folder.parent_id == folder.parent_id, Folder.name == folder.name, Folder.deleted_at.is_(None))):
+                raise ValueError(f"Folder with name '{folder.name}' already exists in the parent folder.")
+
+            session.execute(update(Folder).where(Folder.id == folder.id).values(deleted_at=None).execution_options(synchronize_session=False))
+            self._invalidate(session, ('folder', folder.id))
+            self._invalidate_below(session, folder.id)
+
+            #files purged early to free their URLs left the subtree's counters stale, so recount them before adding them back above
+            prefix = _subtree_prefix(folder.path, folder.id)
+            session.execute(text(REBUILD_FOLDER_STATS_SQL + " WHERE folders.id = :folder_id OR (folders.path >= :prefix AND folders.path < :prefix_end)"),
+                            {'folder_id': folder.id, 'prefix': prefix, 'prefix_end': prefix[:-1] + '0'})
+            subtree = session.execute(
+                select(Folder.total_file_count, Folder.total_folder_count, Folder.summarized_file_count).where(Folder.id == folder.id)
+            ).one()
+
+            changes = _StatChanges()
+            changes.add(folder.parent_id, _parent_path(folder.path), folders=1, total_files=subtree.total_file_count,
+                        total_folders=subtree.total_folder_count + 1, summarized=subtree.summarized_file_count)
+            changes.apply(session)
+
+            self._record(session, ChangeEvent(ChangeType.CREATED, 'folder', folder.id, folder.parent_id, folder.name))
+
+    def restore_file(self, file_id: int):
+        """
+        Brings back a file removed by remove_file.
+
+        Args:
+            file_id (int): The removed file. Restoring a file that isn't removed does nothing.
+
+        Raises:
+            ValueError: If the file was already purged, its folder is removed, or a file with the
+                same name was added to the folder meanwhile.
+        """
+        with self._session_scope(write=True) as session:
+            file = session.execute(
+                select(File.id, File.name, File.folder_id, File.description, File.deleted_at, Folder.path, _LIVE_FOLDER.label('folder_live'))
+                .join(Folder, Folder.id == File.folder_id)
+                .where(File.id == file_id)
+            ).one_or_none()
+
             if not file:
                 raise ValueError(f"File: '{file_id}' does not exist.")
-            
-            #if file is already in the new folder
-            if(file.folder_id == new_folder_id):
+            if file.deleted_at is None:
                 return
-            
-            #find the new folder
-            new_folder = session.query(Folder).filter_by(id=new_folder_id).one_or_none()
-            
-            if not new_folder:
-                raise ValueError(f"New Folder: '{new_folder_id}' does not exist.")
-            
-            # Move the file to the new folder
-            file.folder = new_folder
-            session.commit()
-            
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
-            
+
+            # Ensure that the folder is live and has no new file with that name
+            if not file.folder_live:
+                raise ValueError(f"File: '{file_id}' is inside a removed folder.")
+            if session.scalar(select(File.id).where(File.folder_id == file.folder_id, File.name == file.name, File.deleted_at.is_(None))):
+                raise ValueError(f"File with name '{file.name}' already exists in the folder.")
+
+            session.execute(update(File).where(File.id == file.id).values(deleted_at=None).execution_options(synchronize_session=False))
+            self._invalidate(session, ('file', file.id))
+
+            changes = _StatChanges()
+            changes.add(file.folder_id, file.path, files=1, total_files=1, summarized=int(_is_summarized(file.description)))
+            changes.apply(session)
+
+            self._record(session, ChangeEvent(ChangeType.CREATED, 'file', file.id, file.folder_id, file.name, file.description))
+
+    def purge_deleted(self, max_rows: int = 1000, grace_period: float = 0.0) -> int:
+        """
+        Permanently deletes removed files and folders, at most max_rows of them per call.
+
+        Each call is one short transaction, however big the removed subtrees are; call it until
+        it returns 0 to purge everything, or let a TombstoneCollector do so in the background.
+        A removed folder's contents are deleted before the folder itself, so a subtree purged
+        over several calls stays hidden throughout.
+
+        Args:
+            max_rows (int): The most files and folders to delete in this call.
+            grace_period (float): Only purge what was removed at least this many seconds ago,
+                so it can still be restored until then.
+
+        Returns:
+            int: How many files and folders were deleted.
+        """
+        cutoff = time.time() - grace_period
+        budget = max_rows
+
+        with self._session_scope(write=True) as session:
+            def delete_batch(model, condition) -> int:
+                selected = select(model.id).where(condition).limit(budget)
+                return session.execute(delete(model).where(model.id.in_(selected)).execution_options(synchronize_session=False)).rowcount
+
+            # Files removed on their own
+            budget -= delete_batch(File, File.deleted_at <= cutoff)
+
+            # Then removed folders, oldest first: their files, the folders below them, and finally the tombstone
+            while budget > 0:
+                tombstone = session.execute(
+                    select(Folder.id, Folder.path).where(Folder.deleted_at <= cutoff).order_by(Folder.deleted_at, Folder.id).limit(1)
+                ).first()
+                if tombstone is None:
+                    break
+
+                below = _within_subtree(_subtree_prefix(tombstone.path, tombstone.id))
+                budget -= delete_batch(File, File.folder_id.in_(select(Folder.id).where(or_(Folder.id == tombstone.id, below))))
+                if budget > 0:
+                    budget -= delete_batch(Folder, below)
+                if budget > 0:
+                    budget -= delete_batch(Folder, Folder.id == tombstone.id)
+
+        return max_rows - budget
+
+    def move_file(self, file_id: int, new_folder_id: int):
+        self.move_items(file_ids=[file_id], new_parent_id=new_folder_id)
+
     def move_folder(self, folder_id: int, new_parent_id: int):
-        session = self.Session()
-        
-        try:
-            folder = session.query(Folder).filter_by(id=folder_id).one_or_none()
-            
-            if not folder:
-                raise ValueError(f"Folder: '{folder_id}' does not exist.")
-            elif (folder.parent is None):
-                raise ValueError("Cannot move the root folder.")
-            elif (folder.parent_id == new_parent_id):
-                #if folder is already in the new parent folder
-                return
-            
-            #find the new parent folder
-            new_parent = session.query(Folder).filter_by(id=new_parent_id).one_or_none()
-            
-            if not new_parent:
+        self.move_items(folder_ids=[folder_id], new_parent_id=new_parent_id)
+
+    def move_items(self, file_ids: list[int] = (), folder_ids: list[int] = (), new_parent_id: int = None):
+        """
+        Moves many files and folders into one folder in a single transaction.
+
+        The new parent and every moved folder are read with one query, which is enough to reject
+        moves into a folder's own subtree and to carry subtrees over to another project. Items
+        already in the new parent are skipped, and a folder selected along with one of its
+        ancestors simply travels with that ancestor.
+
+        Args:
+            file_ids (list[int]): The files to move.
+            folder_ids (list[int]): The folders to move, along with everything inside them.
+            new_parent_id (int): The folder to move them into.
+
+        Raises:
+            ValueError: If an item or the new parent is missing, a root folder or cycle is involved,
+                or a name would collide inside the new parent. Nothing is moved in that case.
+        """
+        file_ids = list(dict.fromkeys(file_ids))
+        folder_ids = list(dict.fromkeys(folder_ids))
+        if new_parent_id is None:
+            raise ValueError("New parent folder ID must be provided.")
+
+        with self._session_scope(write=True) as session:
+            # Read the new parent and the moved folders' ancestry in one query
+            folders = {}
+            for chunk in _chunked([new_parent_id, *folder_ids]):
+                for folder in session.execute(
+                    select(Folder.id, Folder.name, Folder.parent_id, Folder.project_id, Folder.path, Folder.depth).where(Folder.id.in_(chunk), _LIVE_FOLDER)
+                ):
+                    folders[folder.id] = folder
+
+            new_parent = folders.get(new_parent_id)
+            if new_parent is None:
                 raise ValueError(f"New Parent Folder: '{new_parent_id}' does not exist.")
-            
-            # Move the folder to the new parent
-            folder.parent = new_parent
-            session.commit()
-            
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
-            
+            new_path = _subtree_prefix(new_parent.path, new_parent.id)
+
+            for folder_id in folder_ids:
+                folder = folders.get(folder_id)
+                if folder is None:
+                    raise ValueError(f"Folder: '{folder_id}' does not exist.")
+                if folder.parent_id is None:
+                    raise ValueError("Cannot move the root folder.")
+                # Don't move a folder into itself or one of its descendants
+                if new_path.startswith(_subtree_prefix(folder.path, folder.id)):
+                    raise ValueError("Cannot move a folder into itself or one of its subfolders.")
+
+            # Folders inside another moved folder travel with it, and folders already in place stay put
+            selected = set(folder_ids)
+            moved_folders = [folders[folder_id] for folder_id in folder_ids
+                             if not selected.intersection(_ancestor_ids(folders[folder_id].path)) and folders[folder_id].parent_id != new_parent_id]
+
+            files = {}
+            for chunk in _chunked(file_ids):
+                for file in session.execute(
+                    select(File.id, File.name, File.folder_id, File.description).join(Folder, Folder.id == File.folder_id).where(File.id.in_(chunk), _LIVE_FILE)
+                ):
+                    files[file.id] = file
+
+            for file_id in file_ids:
+                if file_id not in files:
+                    raise ValueError(f"File: '{file_id}' does not exist.")
+            moved_files = [files[file_id] for file_id in file_ids if files[file_id].folder_id != new_parent_id]
+
+            # Ensure that nothing collides by name inside the new parent
+            for model, moved, kind in ((Folder, moved_folders, "Folder"), (File, moved_files, "File")):
+                names = [item.name for item in moved]
+                if len(set(names)) != len(names):
+                    raise ValueError(f"Two {kind.lower()}s with the same name can't be moved into the same folder.")
+
+                parent_column = Folder.parent_id if model is Folder else File.folder_id
+                for chunk in _chunked(names):
+                    existing = session.scalars(select(model.name).where(parent_column == new_parent_id, model.name.in_(chunk), model.deleted_at.is_(None))).first()
+                    if existing:
+                        raise ValueError(f"{kind} with name '{existing}' already exists in the new parent folder.")
+
+            # Read where the moved items come from, for the counters
+            old_paths = {}
+            for chunk in _chunked(list({file.folder_id for file in moved_files} | {folder.parent_id for folder in moved_folders})):
+                old_paths.update(session.execute(select(Folder.id, Folder.path).where(Folder.id.in_(chunk))).all())
+
+            # Move the files in one statement per chunk
+            for chunk in _chunked([file.id for file in moved_files]):
+                session.execute(
+                    update(File).where(File.id.in_(chunk)).values(folder_id=new_parent_id).execution_options(synchronize_session='fetch')
+                )
+
+            #the files' counters go first, so the moved folders' totals read below no longer include files that left them
+            changes = _StatChanges()
+            for file in moved_files:
+                summarized = int(_is_summarized(file.description))
+                changes.add(file.folder_id, old_paths[file.folder_id], files=-1, total_files=-1, summarized=-summarized)
+                changes.add(new_parent_id, new_parent.path, files=1, total_files=1, summarized=summarized)
+            changes.apply(session)
+
+            totals = {}
+            for chunk in _chunked([folder.id for folder in moved_folders]):
+                for row in session.execute(select(Folder.id, Folder.total_file_count, Folder.total_folder_count, Folder.summarized_file_count).where(Folder.id.in_(chunk))):
+                    totals[row.id] = row
+
+            for folder in moved_folders:
+                subtree = totals[folder.id]
+                changes.add(folder.parent_id, old_paths[folder.parent_id], folders=-1, total_files=-subtree.total_file_count,
+                            total_folders=-(subtree.total_folder_count + 1), summarized=-subtree.summarized_file_count)
+                changes.add(new_parent_id, new_parent.path, folders=1, total_files=subtree.total_file_count,
+                            total_folders=subtree.total_folder_count + 1, summarized=subtree.summarized_file_count)
+            changes.apply(session)
+
+            # Re-parent each folder and re-root the ancestry of everything below it in one statement
+            for folder in moved_folders:
+                old_prefix = _subtree_prefix(folder.path, folder.id)
+                new_prefix = _subtree_prefix(new_path, folder.id)
+                is_moved_folder = Folder.id == folder.id
+                session.execute(
+                    update(Folder)
+                    .where(or_(is_moved_folder, _within_subtree(old_prefix)))
+                    .values(parent_id=case((is_moved_folder, new_parent_id), else_=Folder.parent_id),
+                            path=case((is_moved_folder, new_path), else_=literal(new_prefix) + func.substr(Folder.path, len(old_prefix) + 1)),
+                            depth=Folder.depth + (new_parent.depth + 1 - folder.depth),
+                            project_id=new_parent.project_id)
+                    .execution_options(synchronize_session='fetch')
+                )
+
+            self._invalidate(session, *[('file', file.id) for file in moved_files], *[('folder', folder.id) for folder in moved_folders])
+            #the cached rows below a moved folder have a new ancestry, so they check theirs again too
+            self._invalidate_below(session, *[folder.id for folder in moved_folders])
+            self._record(session,
+                         *[ChangeEvent(ChangeType.MOVED, 'folder', folder.id, new_parent_id, folder.name, old_parent_id=folder.parent_id) for folder in moved_folders],
+                         *[ChangeEvent(ChangeType.MOVED, 'file', file.id, new_parent_id, file.name, file.description, file.folder_id) for file in moved_files])
+
     def validate_folder(self, folder_id: int):
-        session = self.Session()
-        
         try:
-            folder = session.query(Folder).filter_by(id=folder_id).one_or_none()
-            
-            if not folder:
-                return False
-            
-            return True
-            
+            with self._session_scope() as session:
+                return session.scalar(select(Folder.id).where(Folder.id == folder_id, _LIVE_FOLDER)) is not None
+
         except:
             return False
-        finally:
-            session.close()
-            
+
     def get_file(self, file_id: int):
-        session = self.Session()
-        
-        try:
-            file = session.query(File).filter_by(id=file_id).one_or_none()
-            
+        cached = self.cache.get(('file', file_id))
+        #a folder removed or moved above the cached file since it was read may have hidden it
+        if cached is not None and self._ancestry_changes.unchanged_since(cached[2], cached[1]):
+            return cached[0]
+
+        token = self.cache.read_token()
+        epoch = self._ancestry_changes.epoch
+        with self._session_scope() as session:
+            file = session.execute(
+                select(File.id, File.name, File.URL, File.description, File.folder_id, Folder.path)
+                .join(Folder, Folder.id == File.folder_id).where(File.id == file_id, _LIVE_FILE)
+            ).one_or_none()
+
             if not file:
                 raise ValueError(f"File: '{file_id}' does not exist.")
-            
-            return FileInfo(file.id, file.name, file.URL, file.description)
-            
-        except Exception as e:
-            raise e
-        finally:
-            session.close()
-            
+
+            file_info = FileInfo(file.id, file.name, file.URL, file.description)
+
+        self._cache_put(('file', file_id), (file_info, (*_ancestor_ids(file.path), file.folder_id), epoch), token)
+        return file_info
+
+    def search_files(self, query: str, project_id: int = None, limit: int = 50, offset: int = 0) -> list[FileInfo]:
+        """
+        Searches file names and summaries, best matches first.
+
+        Every word in the query has to match the start of a word in the file's name or summary.
+
+        Args:
+            query (str): The text typed by the user.
+            project_id (int): Only return files from this project, if given.
+            limit (int): The maximum number of results to return.
+            offset (int): The number of results to skip, for paging.
+
+        Returns:
+            list[FileInfo]: The matching files, ranked by relevance.
+        """
+        terms = _search_terms(query)
+        if not terms:
+            return []
+
+        with self._session_scope() as session:
+            if self.search_enabled:
+                statement = (
+                    select(File.id, File.name, File.URL, File.description)
+                    .select_from(_files_fts)
+                    .join(File, File.id == _files_fts.c.rowid)
+                    .where(_files_fts.c.files_fts.op('MATCH')(" ".join(f'"{term}"*' for term in terms)))
+                    .order_by(_SEARCH_RANK)
+                )
+            else:
+                statement = select(File.id, File.name, File.URL, File.description).order_by(_FILE_NAME_ORDER, File.id)
+                for term in terms:
+                    pattern = f"%{term}%"
+                    statement = statement.where(or_(File.name.ilike(pattern), File.description.ilike(pattern)))
+
+            statement = statement.where(File.deleted_at.is_(None), _IN_LIVE_FOLDER)
+            if project_id is not None:
+                statement = statement.join(Folder, Folder.id == File.folder_id).where(Folder.project_id == project_id)
+
+            statement = statement.limit(limit).offset(offset)
+            return [FileInfo(*file) for file in _fetch_rows(session, statement)]
+
     def update_file_summary(self, file_id: int, summary: str):
-        session = self.Session()
-        
-        try:
-            file = session.query(File).filter_by(id=file_id).one_or_none()
-            
+        with self._session_scope(write=True) as session:
+            file = session.query(File).join(Folder, Folder.id == File.folder_id).filter(File.id == file_id, _LIVE_FILE).one_or_none()
+
             if not file:
                 raise ValueError(f"File: '{file_id}' does not exist.")
-            
+
             # Update the file's summary
+            self._invalidate(session, ('file', file.id))
+            summarized_change = int(_is_summarized(summary)) - int(_is_summarized(file.description))
             file.description = summary
-            session.commit()
-            
-        except Exception as e:
-            session.rollback()
-            raise e
-        finally:
-            session.close()
+            session.flush()
+
+            if summarized_change:
+                changes = _StatChanges()
+                changes.add(file.folder_id, file.folder.path, summarized=summarized_change)
+                changes.apply(session)
+
+            self._record(session, ChangeEvent(ChangeType.SUMMARY_UPDATED, 'file', file.id, file.folder_id, file.name, summary))
+
+    def enqueue_job(self, kind: str, priority: int = 0, url: str = None, folder_id: int = None, file_id: int = None, description: str = None) -> JobInfo:
+        """
+        Records a pending job, so it survives the app closing before a worker gets to it.
+
+        Inside a batch the job is queued in the same transaction as the batch's other writes,
+        e.g. the file whose summary it will fetch.
+
+        Args:
+            kind (str): What to do, as understood by the workers.
+            priority (int): Lower runs sooner.
+
+        Returns:
+            JobInfo: The pending job.
+        """
+        now = time.time()
+        with self._session_scope(write=True) as session:
+            row = session.execute(
+                insert(Job).values(kind=kind, state=JOB_PENDING, priority=priority, URL=url, folder_id=folder_id, file_id=file_id,
+                                   description=description, attempts=0, created_at=now, updated_at=now).returning(*_JOB_COLUMNS)
+            ).one()
+        return JobInfo(*row)
+
+    def claim_job(self, job_id: int) -> JobInfo | None:
+        """
+        Marks a pending job as running, for the one worker that gets to run it.
+
+        Returns:
+            JobInfo | None: The running job, or None if it isn't pending (another worker claimed
+                it, or it already ran), in which case it must not be run.
+        """
+        with self._session_scope(write=True) as session:
+            #a single conditional UPDATE, so two workers can't both see the job as pending
+            row = session.execute(
+                update(Job).where(Job.id == job_id, Job.state == JOB_PENDING)
+                .values(state=JOB_RUNNING, attempts=Job.attempts + 1, updated_at=time.time())
+                .returning(*_JOB_COLUMNS).execution_options(synchronize_session=False)
+            ).first()
+        return JobInfo(*row) if row else None
+
+    def finish_job(self, job_id: int):
+        """
+        Marks a running job as done. Call it in the batch that saves the job's work, so the work
+        and the job's state are committed together and a restart never runs it again.
+        """
+        with self._session_scope(write=True) as session:
+            session.execute(
+                update(Job).where(Job.id == job_id, Job.state == JOB_RUNNING)
+                .values(state=JOB_DONE, updated_at=time.time()).execution_options(synchronize_session=False)
+            )
+
+    def fail_job(self, job_id: int, error: str):
+        """
+        Marks a running job as failed for good, with the reason why. It stays in the jobs table,
+        where list_jobs(JOB_FAILED) finds it and replay_job can run it again.
+        """
+        with self._session_scope(write=True) as session:
+            session.execute(
+                update(Job).where(Job.id == job_id, Job.state == JOB_RUNNING)
+                .values(state=JOB_FAILED, last_error=error, updated_at=time.time()).execution_options(synchronize_session=False)
+            )
+
+    def retry_job(self, job_id: int, error: str, run_after: float) -> JobInfo | None:
+        """
+        Makes a running job that failed pending again, to be retried once run_after (a time.time()
+        timestamp) has passed. The wait is recorded so it outlasts a restart.
+
+        Returns:
+            JobInfo | None: The pending job, or None if it wasn't running.
+        """
+        with self._session_scope(write=True) as session:
+            row = session.execute(
+                update(Job).where(Job.id == job_id, Job.state == JOB_RUNNING)
+                .values(state=JOB_PENDING, last_error=error, run_after=run_after, updated_at=time.time())
+                .returning(*_JOB_COLUMNS).execution_options(synchronize_session=False)
+            ).first()
+        return JobInfo(*row) if row else None
+
+    def replay_job(self, job_id: int) -> JobInfo | None:
+        """
+        Makes a failed job pending again with a fresh count of attempts, e.g. once the problem
+        that made it fail was fixed. The caller queues the returned job.
+
+        Returns:
+            JobInfo | None: The pending job, or None if it hadn't failed.
+        """
+        with self._session_scope(write=True) as session:
+            row = session.execute(
+                update(Job).where(Job.id == job_id, Job.state == JOB_FAILED)
+                .values(state=JOB_PENDING, attempts=0, run_after=None, updated_at=time.time())
+                .returning(*_JOB_COLUMNS).execution_options(synchronize_session=False)
+            ).first()
+        return JobInfo(*row) if row else None
+
+    def list_jobs(self, state: str, max: int = None) -> list[JobInfo]:
+        """
+        Returns the jobs in a state, most recently updated first, e.g. the failed ones to inspect.
+
+        Args:
+            state (str): JOB_PENDING, JOB_RUNNING, JOB_DONE or JOB_FAILED.
+            max (int): The most jobs to return.
+        """
+        with self._session_scope() as session:
+            rows = session.execute(
+                select(*_JOB_COLUMNS).where(Job.state == state).order_by(Job.updated_at.desc(), Job.id.desc()).limit(max)
+            ).all()
+        return [JobInfo(*row) for row in rows]
+
+    def resume_jobs(self) -> list[JobInfo]:
+        """
+        Returns every pending job, in the order they should run, to queue them again on startup.
+
+        Jobs still marked as running were interrupted by the app closing; their work was never
+        committed, so they are made pending again. Jobs waiting to be retried keep their
+        run_after. Only call this before any worker starts.
+        """
+        with self._session_scope(write=True) as session:
+            session.execute(
+                update(Job).where(Job.state == JOB_RUNNING)
+                .values(state=JOB_PENDING, updated_at=time.time()).execution_options(synchronize_session=False)
+            )
+            rows = session.execute(select(*_JOB_COLUMNS).where(Job.state == JOB_PENDING).order_by(Job.priority, Job.id)).all()
+        return [JobInfo(*row) for row in rows]
+
+    def boost_jobs(self, priority: int, kind: str, file_id: int) -> int:
+        """
+        Moves a file's pending jobs of one kind up to a priority, so they keep it across restarts.
+
+        Returns:
+            int: How many jobs were moved up.
+        """
+        with self._session_scope(write=True) as session:
+            return session.execute(
+                update(Job).where(Job.state == JOB_PENDING, Job.kind == kind, Job.file_id == file_id, Job.priority > priority)
+                .values(priority=priority, updated_at=time.time()).execution_options(synchronize_session=False)
+            ).rowcount
 
 
 # Example usage
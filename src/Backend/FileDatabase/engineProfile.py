@@ -0,0 +1,128 @@
+from typing import NamedTuple
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+
+'''
+class EngineProfile(NamedTuple):
+    journal_mode: str
+    synchronous: str
+    mmap_size: int
+    cache_size: int
+    busy_timeout: int
+    temp_store: str
+    pool_size: int
+    max_overflow: int
+'''
+class EngineProfile(NamedTuple):
+    journal_mode: str = 'WAL'           # readers don't block behind the writer (and vice versa)
+    synchronous: str = 'NORMAL'         # safe with WAL, skips an fsync per commit
+    mmap_size: int = 256 * 1024 * 1024  # bytes of the database file to memory map
+    cache_size: int = -64 * 1024        # page cache per connection; negative values are KiB
+    busy_timeout: int = 5000            # ms to wait on a locked database before failing
+    temp_store: str = 'MEMORY'          # keep temp tables and sort spills off disk
+    pool_size: int = 5                  # connections kept open for reuse
+    max_overflow: int = 10              # extra connections allowed under load
+
+DEFAULT_PROFILE = EngineProfile()
+
+
+def apply_engine_profile(engine: Engine, profile: EngineProfile = DEFAULT_PROFILE):
+    """
+    Runs the profile's PRAGMAs on every new connection of a SQLite engine.
+
+    This also makes SQLAlchemy emit BEGIN itself instead of relying on pysqlite's implicit
+    transactions, which is required for SAVEPOINTs to work.
+
+    Args:
+        engine (Engine): The engine to configure. Engines for other databases are left alone.
+        profile (EngineProfile): The settings to apply.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    in_memory = engine.url.database in (None, '', ':memory:')
+
+    @event.listens_for(engine, "connect")
+    def _configure_connection(dbapi_connection, connection_record):
+        #pysqlite opens transactions lazily and breaks SAVEPOINT, so let SQLAlchemy emit BEGIN itself
+        dbapi_connection.isolation_level = None
+
+        cursor = dbapi_connection.cursor()
+        try:
+            #in-memory databases have no journal or file to map
+            if not in_memory:
+                cursor.execute(f"PRAGMA journal_mode={profile.journal_mode}")
+                cursor.execute(f"PRAGMA mmap_size={int(profile.mmap_size)}")
+            cursor.execute(f"PRAGMA synchronous={profile.synchronous}")
+            cursor.execute(f"PRAGMA cache_size={int(profile.cache_size)}")
+            cursor.execute(f"PRAGMA busy_timeout={int(profile.busy_timeout)}")
+            cursor.execute(f"PRAGMA temp_store={profile.temp_store}")
+        finally:
+            cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def _emit_begin(connection):
+        #write transactions take the write lock up front: two that both read first would deadlock upgrading their locks
+        if connection.get_execution_options().get('begin_immediate'):
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        else:
+            connection.exec_driver_sql("BEGIN")
+
+
+def for_writes(engine: Engine | AsyncEngine) -> Engine | AsyncEngine:
+    """
+    Returns a view of an engine whose transactions take SQLite's write lock as they begin.
+
+    Concurrent writers then queue up on busy_timeout instead of failing with "database is locked".
+    """
+    return engine.execution_options(begin_immediate=True)
+
+
+def create_tuned_engine(db_url: str, profile: EngineProfile = DEFAULT_PROFILE, **engine_kwargs) -> Engine:
+    """
+    Creates an engine with the profile's connection pool and connect-time PRAGMAs.
+
+    Args:
+        db_url (str): The database URL, e.g. 'sqlite:///file_database.db'.
+        profile (EngineProfile): The tuning settings to use.
+        **engine_kwargs: Passed through to sqlalchemy.create_engine.
+
+    Returns:
+        Engine: The configured engine.
+    """
+    url = make_url(db_url)
+    _set_pool_options(url, profile, engine_kwargs)
+    engine = create_engine(url, **engine_kwargs)
+    apply_engine_profile(engine, profile)
+    return engine
+
+
+def create_tuned_async_engine(db_url: str, profile: EngineProfile = DEFAULT_PROFILE, **engine_kwargs) -> AsyncEngine:
+    """
+    Creates an asyncio engine (e.g. 'sqlite+aiosqlite:///file_database.db') with the same pool and PRAGMAs.
+
+    Args:
+        db_url (str): The database URL, using an async driver.
+        profile (EngineProfile): The tuning settings to use.
+        **engine_kwargs: Passed through to sqlalchemy.ext.asyncio.create_async_engine.
+
+    Returns:
+        AsyncEngine: The configured engine.
+    """
+    url = make_url(db_url)
+    _set_pool_options(url, profile, engine_kwargs)
+    engine = create_async_engine(url, **engine_kwargs)
+    apply_engine_profile(engine.sync_engine, profile)
+    return engine
+
+
+def _set_pool_options(url: URL, profile: EngineProfile, engine_kwargs: dict):
+    #file databases get a shared pool usable from any thread; in-memory ones keep SQLAlchemy's default
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        engine_kwargs.setdefault('pool_size', profile.pool_size)
+        engine_kwargs.setdefault('max_overflow', profile.max_overflow)
+        connect_args = engine_kwargs.setdefault('connect_args', {})
+        connect_args.setdefault('check_same_thread', False)
+        connect_args.setdefault('timeout', profile.busy_timeout / 1000)
@@ -0,0 +1,99 @@
+from typing import NamedTuple, Hashable
+from collections import OrderedDict
+import threading
+
+
+'''
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+    max_size: int
+'''
+class CacheStats(NamedTuple):
+    hits: int
+    misses: int
+    size: int
+    max_size: int
+
+
+class LRUCache:
+    def __init__(self, max_size: int = 4096):
+        """
+        Initializes a thread-safe least-recently-used cache.
+
+        Args:
+            max_size (int): The most entries to keep. 0 disables caching.
+        """
+        if max_size < 0:
+            raise ValueError("Cache size must not be negative.")
+
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        #bumped by every invalidation so reads that raced with a write don't store stale values
+        self._generation = 0
+
+    def get(self, key: Hashable):
+        """
+        Returns the cached value for a key, or None on a miss.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def read_token(self) -> int:
+        """
+        Returns a token to take before reading from the database and hand back to put().
+        """
+        with self._lock:
+            return self._generation
+
+    def put(self, key: Hashable, value, token: int):
+        """
+        Stores a value read from the database, unless something was invalidated since the token was taken.
+        """
+        if self.max_size == 0 or value is None:
+            return
+
+        with self._lock:
+            if token != self._generation:
+                return
+
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *keys: Hashable):
+        """
+        Drops the given keys from the cache.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Drops every entry and resets the hit/miss counters.
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self.hits, self.misses, len(self._entries), self.max_size)
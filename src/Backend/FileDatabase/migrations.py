@@ -0,0 +1,197 @@
+"""
+Versioned schema migrations for the file database.
+
+The schema version is kept in SQLite's user_version header field. A database that is
+already at SCHEMA_VERSION is opened without touching the schema at all; older ones run
+the missing steps in order, inside the caller's transaction. The steps are written so they
+also cope with databases upgraded piecemeal before versions were recorded.
+"""
+from sqlalchemy import MetaData, inspect
+from sqlalchemy.engine import Connection
+
+
+#"below" (a folder inside the recounted one) is live unless it, or a folder between it and the recounted one, has a tombstone
+_LIVE_BELOW = """below.deleted_at IS NULL AND NOT EXISTS (
+            SELECT 1 FROM folders AS tomb
+            WHERE tomb.deleted_at IS NOT NULL AND tomb.path >= folders.path || folders.id || '/'
+              AND below.path >= tomb.path || tomb.id || '/' AND below.path < tomb.path || tomb.id || '0'
+        )"""
+
+#recounts every folder's counters from the live rows of the files and folders tables (append a WHERE clause to recount only some)
+REBUILD_FOLDER_STATS_SQL = f"""
+    UPDATE folders SET
+        file_count = (SELECT count(*) FROM files WHERE files.folder_id = folders.id AND files.deleted_at IS NULL),
+        folder_count = (SELECT count(*) FROM folders AS child WHERE child.parent_id = folders.id AND child.deleted_at IS NULL),
+        total_folder_count = (
+            SELECT count(*) FROM folders AS below
+            WHERE below.path >= folders.path || folders.id || '/' AND below.path < folders.path || folders.id || '0'
+              AND {_LIVE_BELOW}
+        ),
+        total_file_count = (
+            SELECT count(*) FROM files JOIN folders AS below ON files.folder_id = below.id
+            WHERE files.deleted_at IS NULL
+              AND (below.id = folders.id
+                   OR (below.path >= folders.path || folders.id || '/' AND below.path < folders.path || folders.id || '0' AND {_LIVE_BELOW}))
+        ),
+        summarized_file_count = (
+            SELECT count(*) FROM files JOIN folders AS below ON files.folder_id = below.id
+            WHERE files.deleted_at IS NULL AND files.description <> ''
+              AND (below.id = folders.id
+                   OR (below.path >= folders.path || folders.id || '/' AND below.path < folders.path || folders.id || '0' AND {_LIVE_BELOW}))
+        )
+"""
+
+
+def _add_columns(connection: Connection, table_name: str, columns: dict[str, str]) -> list[str]:
+    #ALTER in the columns the table doesn't have yet, and return their names
+    existing = {column['name'] for column in inspect(connection).get_columns(table_name)}
+    added = [name for name in columns if name not in existing]
+    for name in added:
+        connection.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {name} {columns[name]}")
+    return added
+
+
+#each step returns True if the folder counters have to be recounted once every step has run
+def _add_ancestry(connection: Connection) -> bool:
+    # Version 1: materialized path and depth on folders
+    _add_columns(connection, 'folders', {'path': "VARCHAR", 'depth': "INTEGER NOT NULL DEFAULT 0"})
+
+    # Backfill the ancestry of any folder that doesn't have one yet
+    connection.exec_driver_sql("""
+        WITH RECURSIVE tree(id, path, depth) AS (
+            SELECT id, '/', 0 FROM folders WHERE parent_id IS NULL
+            UNION ALL
+            SELECT folders.id, tree.path || tree.id || '/', tree.depth + 1
+            FROM folders JOIN tree ON folders.parent_id = tree.id
+        )
+        UPDATE folders
+        SET path = (SELECT tree.path FROM tree WHERE tree.id = folders.id),
+            depth = (SELECT tree.depth FROM tree WHERE tree.id = folders.id)
+        WHERE path IS NULL
+    """)
+    return False
+
+
+def _add_folder_counters(connection: Connection) -> bool:
+    # Version 2: per-folder file and subfolder counters
+    added = _add_columns(connection, 'folders', {
+        'file_count': "INTEGER NOT NULL DEFAULT 0",
+        'folder_count': "INTEGER NOT NULL DEFAULT 0",
+        'total_file_count': "INTEGER NOT NULL DEFAULT 0",
+        'total_folder_count': "INTEGER NOT NULL DEFAULT 0",
+        'summarized_file_count': "INTEGER NOT NULL DEFAULT 0",
+    })
+
+    # Count what is already in the folders that just got their counters
+    return bool(added)
+
+
+def _add_lookup_indexes(connection: Connection) -> bool:
+    # Version 3: indexes for keyset paging, name collision checks, ancestry and project lookups
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS ix_projects_status_id ON projects (status, id)",
+        "CREATE INDEX IF NOT EXISTS ix_projects_root_folder_id ON projects (root_folder_id)",
+        "CREATE INDEX IF NOT EXISTS ix_folders_project_id ON folders (project_id)",
+        "CREATE INDEX IF NOT EXISTS ix_folders_path ON folders (path)",
+        #(parent_id, name) and (folder_id, name) back the name collision checks as well as paging
+        "CREATE INDEX IF NOT EXISTS ix_folders_parent_name_id ON folders (parent_id, name, id)",
+        "CREATE INDEX IF NOT EXISTS ix_files_folder_name_id ON files (folder_id, name, id)",
+        #the composite indexes above start with these columns, so the single-column ones only slow down writes
+        "DROP INDEX IF EXISTS ix_folders_parent_id",
+        "DROP INDEX IF EXISTS ix_files_folder_id",
+    ):
+        connection.exec_driver_sql(statement)
+    return False
+
+
+def _add_tombstones(connection: Connection) -> bool:
+    # Version 4: soft delete, with partial indexes so finding the (few) tombstones doesn't scan the tables
+    for table_name in ('folders', 'files'):
+        _add_columns(connection, table_name, {'deleted_at': "FLOAT"})
+        connection.exec_driver_sql(
+            f"CREATE INDEX IF NOT EXISTS ix_{table_name}_deleted_at ON {table_name} (deleted_at) WHERE deleted_at IS NOT NULL")
+    return False
+
+
+def _add_jobs(connection: Connection) -> bool:
+    # Version 5: the persistent job queue, a new table that create_all has already made with its index
+    return False
+
+
+def _add_job_retries(connection: Connection) -> bool:
+    # Version 6: when a job that failed may be retried
+    _add_columns(connection, 'jobs', {'run_after': "FLOAT"})
+    return False
+
+
+def _add_nocase_name_indexes(connection: Connection) -> bool:
+    # Version 7: names are listed case-insensitively, so paging by name needs NOCASE indexes
+    for statement in (
+        "CREATE INDEX IF NOT EXISTS ix_projects_name_nocase_id ON projects (name COLLATE NOCASE, id)",
+        "CREATE INDEX IF NOT EXISTS ix_folders_parent_name_nocase_id ON folders (parent_id, name COLLATE NOCASE, id)",
+        "CREATE INDEX IF NOT EXISTS ix_files_folder_name_nocase_id ON files (folder_id, name COLLATE NOCASE, id)",
+    ):
+        connection.exec_driver_sql(statement)
+    return False
+
+
+#(version, step) pairs: running every step above a database's version brings it up to date
+MIGRATIONS = (
+    (1, _add_ancestry),
+    (2, _add_folder_counters),
+    (3, _add_lookup_indexes),
+    (4, _add_tombstones),
+    (5, _add_jobs),
+    (6, _add_job_retries),
+    (7, _add_nocase_name_indexes),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(connection: Connection) -> int:
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate(connection: Connection, metadata: MetaData) -> int:
+    """
+    Brings a database's schema up to SCHEMA_VERSION.
+
+    New databases get the current tables straight from the metadata. Existing ones run
+    every migration above their stored version. Either way the version is then stamped, so
+    the next start skips all of this.
+
+    Args:
+        connection (Connection): A connection inside a transaction.
+        metadata (MetaData): The models' metadata, used to create missing tables.
+
+    Returns:
+        int: The version the database was at before migrating.
+
+    Raises:
+        ValueError: If the database was written by a newer version of the schema.
+    """
+    #only SQLite records a version; other databases just get their missing tables
+    if connection.dialect.name != 'sqlite':
+        metadata.create_all(connection)
+        return SCHEMA_VERSION
+
+    version = get_schema_version(connection)
+    if version == SCHEMA_VERSION:
+        return version
+    if version > SCHEMA_VERSION:
+        raise ValueError(f"The database uses schema version {version}, newer than the supported {SCHEMA_VERSION}.")
+
+    # Create the tables that are missing, then upgrade the ones that were already there
+    existing_tables = set(inspect(connection).get_table_names())
+    metadata.create_all(connection)
+    if existing_tables.intersection(metadata.tables):
+        recount = False
+        for target, step in MIGRATIONS:
+            if version < target:
+                recount = step(connection) or recount
+        if recount:
+            connection.exec_driver_sql(REBUILD_FOLDER_STATS_SQL)
+
+    connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return version
@@ -0,0 +1,69 @@
+from Backend.FileDatabase.database import fileDatabase
+import threading
+
+
+class TombstoneCollector:
+    def __init__(self, file_database: fileDatabase, interval: float = 5.0, batch_size: int = 1000, grace_period: float = 300.0):
+        """
+        Purges the files and folders removed from a fileDatabase on a background thread.
+
+        remove_file and remove_folder only leave tombstones. Every interval seconds the
+        collector calls purge_deleted in batches of batch_size rows, each in its own short
+        transaction, until nothing is left to purge.
+
+        Args:
+            file_database (fileDatabase): The database to purge.
+            interval (float): Seconds to sleep between collections.
+            batch_size (int): The most rows deleted per transaction.
+            grace_period (float): Seconds a removed item can still be restored before it is purged.
+        """
+        self.file_database = file_database
+        self.interval = interval
+        self.batch_size = batch_size
+        self.grace_period = grace_period
+
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Starts collecting on a daemon thread. Does nothing if it is already running.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = None):
+        """
+        Stops the collector, waiting for the batch in progress to finish.
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def collect(self) -> int:
+        """
+        Purges everything past its grace period now, batch by batch.
+
+        Returns:
+            int: How many files and folders were deleted.
+        """
+        purged = 0
+        while not self._stopping.is_set():
+            count = self.file_database.purge_deleted(max_rows=self.batch_size, grace_period=self.grace_period)
+            purged += count
+            #a short batch means nothing is left
+            if count < self.batch_size:
+                break
+        return purged
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.collect()
+            except Exception as e:
+                print(f"Error purging deleted items: {e}")
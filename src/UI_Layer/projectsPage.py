@@ -1,8 +1,10 @@
 import tkinter as tk
-from tkinter import ttk
-from Backend.FileDatabase.database import fileDatabase
+from tkinter import ttk, messagebox
+from Backend.FileDatabase.database import fileDatabase, FolderInfo, FileInfo, ProjectStats
 from Backend.API_Key_Container.AccountDB import APIKeyManager
 from Backend.API_Connector.FileAdder import FileOrchestrator
+from Backend.FileDatabase.changeFeed import ChangeType
+import queue
 
 class projects_page_base(tk.Frame):
         def __init__(self, parent, fileManager: fileDatabase, apiDatabase: APIKeyManager):
@@ -37,11 +39,12 @@ class projects_page_base(tk.Frame):
             #configure the placeholder to automatically appear and disapear
             self.search_box.bind('<FocusOut>', lambda event: self.search_box_refresh())
             self.search_box.bind('<FocusIn>', lambda event: (self.search_box.delete(0, 'end'), self.search_box.configure(foreground='black')) if self.search_box.get() == self.PLACEHOLDER else None)
+            self.search_box.bind('<Return>', lambda event: self.search())
             
             #create the sort by box
             self.sort_by_box = ttk.Combobox(self, takefocus=False, state='readonly', width=20)
-            self.sort_by_box['values'] = ('Name', 'Status')
-            self.sort_by_box.bind("<<ComboboxSelected>>", lambda event: event.widget.selection_clear())
+            self.sort_by_box['values'] = ('Name', 'Status', 'Files', 'Pending Summaries')
+            self.sort_by_box.bind("<<ComboboxSelected>>", lambda event: (event.widget.selection_clear(), self.update_file_tree()))
             self.sort_by_box.current(0)
             self.sort_by_box.grid(row=0, column=3, sticky="nwe", padx='10p')
             self.grid_columnconfigure(index=2)
@@ -96,9 +99,15 @@ class projects_page_base(tk.Frame):
             self.current_folder_id = None
             self.navigation_stack = []  # back navigation stack
             self.full_path = ""
+            self.tree_generation = 0  # bumped on every reload so stale page loads stop
+            self.showing_search = False
 
             self.update_file_tree()
 
+            #apply committed changes (ours and the file orchestrator's) to the rows instead of reloading them
+            self.changes_queue = fileManager.changes.subscribe_queue()
+            self.after(100, self.poll_changes)
+
         def go_back(self):
             if len(self.navigation_stack) > 1:
                 self.navigation_stack.pop(-1)
@@ -123,9 +132,6 @@ class projects_page_base(tk.Frame):
                 print(e)
                 return
             
-            #reload the projects to show the new project
-            self.update_file_tree()
-            
 
         
         def get_selected_project_id(self):
@@ -149,21 +155,18 @@ class projects_page_base(tk.Frame):
                 try:
                     if(id):
                         self.fileManager.delete_project(id)
-                        self.update_file_tree()
                 except:
                     print("Project not found")
             elif selected_item.startswith("folder-"):
                 try:
                     if(id):
                         self.fileManager.remove_folder(id)
-                        self.update_file_tree()
                 except:
                     print("Folder not found")
             elif selected_item.startswith("file-"):
                 try:
                     if(id):
                         self.fileManager.remove_file(id)
-                        self.update_file_tree()
                 except:
                     print("File not found")
                     
@@ -177,14 +180,12 @@ class projects_page_base(tk.Frame):
                 try:
                     if(id):
                         self.fileManager.rename_project(id, self.rename_entry.get())
-                        self.update_file_tree()
                 except:
                     print("Project not found")
             elif selected_item.startswith("folder-"):
                 try:
                     if(id):
                         self.fileManager.rename_folder(id, self.rename_entry.get())
-                        self.update_file_tree()
                 except:
                     print("Folder not found")
                     
@@ -254,9 +255,11 @@ class projects_page_base(tk.Frame):
                     elif item_type == "File":
                         if self.current_folder_id is None:
                             raise ValueError("You must be inside a folder to create a new file.")
-                        self.threaded_file_adder.queue_add_file(URL=url_entry.get().strip(), folderID=self.current_folder_id, description=desc_entry.get().strip())
+                        self.threaded_file_adder.queue_add_file(URL=url_entry.get().strip(), folderID=self.current_folder_id, description=desc_entry.get().strip(), block=False)
                     win.destroy()
-                    self.update_file_tree()
+                except queue.Full:
+                    #the dialog stays open, so the file can be added again once the queue drains
+                    messagebox.showinfo("Busy", "Too many files are waiting to be added. Please try again in a moment.", parent=win)
                 except Exception as e:
                     print(f"Error: {e}")
                     self.update_file_tree()
@@ -288,39 +291,25 @@ class projects_page_base(tk.Frame):
             if self.current_folder_id in self.navigation_stack:
                 index = self.navigation_stack.index(self.current_folder_id)
                 # Remove all items after the current index
-                self.navigation_stack[:index + 1]
-                
-                #remake the path textbox
-                self.full_path = self.fileManager.get_folder(self.navigation_stack[0]).name
-                for folder_id in self.navigation_stack[1:]:
-                    folder = self.fileManager.get_folder(folder_id)
-                    self.full_path = self.full_path + '/' + folder.name if self.full_path else folder.name
-                    
-                self.path_textbox.config(text="Path: " + self.full_path)
+                self.navigation_stack = self.navigation_stack[:index + 1]
             else:
                 self.navigation_stack.append(self.current_folder_id)
-                
-                #append the new folder to the path
-                new_folder = self.fileManager.get_folder(folder_id)
-                self.full_path = self.full_path + '/' + new_folder.name if self.full_path else new_folder.name
-                self.path_textbox.config(text="Path: " + self.full_path)
+            
+            #remake the path textbox from the root down in one query
+            self.full_path = '/'.join(folder.name for folder in self.fileManager.get_folder_path(folder_id))
+            self.path_textbox.config(text="Path: " + self.full_path)
             
             self.update_file_tree()
 
         def update_file_tree(self):
             # Clear the current file tree
             self.tree.delete(*self.tree.get_children())
+            self.showing_search = False
             
             if self.current_project_id is not None:
-                # Display folders
-                folders = self.fileManager.get_child_folders(identifier=self.current_folder_id)
-                for folder in folders:
-                    self.tree.insert("", "end", iid=f"folder-{folder.id}", values=(folder.name, '', 'Folder'))
-
-                # Display files
-                files = self.fileManager.get_child_files(self.current_folder_id)
-                for file in files:
-                    self.tree.insert("", "end", iid=f"file-{file.id}", values=(file.name, file.description, 'File'))
+                # Display folders and files together, already sorted by name (one query per page)
+                pages = (self.folder_page_rows(page)
+                         for page in self.fileManager.iter_folder_contents(self.current_folder_id, sort='name'))
                 
                 self.PLACEHOLDER = "Search for a file..."
             else:
@@ -330,34 +319,157 @@ class projects_page_base(tk.Frame):
                 # Clear the current project ID
                 self.current_project_id = None
                 
-                # Get the projects from the database
-                all_projects = self.fileManager.list_projects()
-                
-                # Insert the projects into the tree
-                for project in all_projects:
-                    self.tree.insert("", "end", iid=f"project-{project.id}", 
-                        values=(project.name, project.description, project.status))
+                # Get the projects from the database, sorted the way the sort box says
+                sort_by = {"Status": 'status', "Files": 'files', "Pending Summaries": 'pending_files'}.get(self.sort_by_box.get(), 'name')
+                pages = ([self.project_item_row(project) for project in page]
+                         for page in self.fileManager.iter_projects_with_stats(sort_by=sort_by))
                 
                 self.PLACEHOLDER = "Search for a project..."
-                
-            #sort the tree    
-            sort_by = self.sort_by_box.get()
-            if sort_by == "Name":
-                # Get all items in the tree
-                items = [(self.tree.item(item_id, "values")[0], item_id) for item_id in self.tree.get_children()]
-                
-                # Sort items by the "Name" column (case-insensitive)
-                items.sort(key=lambda x: x[0].lower())
-                
-                # Reinsert items in sorted order
-                for index, (name, item_id) in enumerate(items):
-                    self.tree.move(item_id, "", index)
+            
+            # Insert the rows a page at a time
+            self.tree_generation += 1
+            self.insert_tree_pages(pages, self.tree_generation)
                     
             #update the selected item (now None)
             self.deselect()
             self.search_box_refresh()
 
 
+        def project_item_row(self, project):
+            #the status column also shows how far the project's summaries have got
+            progress = f"{project.pending_files} of {project.files} files pending" if project.pending_files else f"{project.files} files"
+            return (f"project-{project.id}", (project.name, project.description, f"{project.status} ({progress})"))
+
+        def folder_page_rows(self, page):
+            #one query for the counts of every folder on the page
+            stats = self.fileManager.get_folders_stats([item.id for item in page if isinstance(item, FolderInfo)])
+            return [self.folder_item_row(item, stats.get(item.id) if isinstance(item, FolderInfo) else None) for item in page]
+
+        def folder_item_row(self, item, stats=None):
+            if isinstance(item, FolderInfo):
+                description = f"{stats.total_files} files, {stats.total_folders} subfolders" if stats else ''
+                return (f"folder-{item.id}", (item.name, description, 'Folder'))
+            return (f"file-{item.id}", (item.name, item.description, 'File'))
+
+        def insert_tree_pages(self, pages, generation):
+            #stop if the tree was reloaded since this load started
+            if generation != self.tree_generation:
+                return
+            
+            page = next(pages, None)
+            if page is None:
+                return
+            
+            for item_id, values in page:
+                #a change applied while the pages load may have inserted the row already
+                if not self.tree.exists(item_id):
+                    self.tree.insert("", "end", iid=item_id, values=values)
+            
+            #let the event loop breathe before loading the next page
+            self.after_idle(self.insert_tree_pages, pages, generation)
+
+        def poll_changes(self):
+            #drain what was committed since the last poll, then check again shortly
+            events = []
+            while True:
+                try:
+                    events.extend(self.changes_queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            if events:
+                try:
+                    self.apply_changes(events)
+                except Exception as e:
+                    print(f"Error applying changes: {e}")
+            
+            self.after(100, self.poll_changes)
+
+        def apply_changes(self, events):
+            if self.current_project_id is None:
+                # Projects come and go as a whole; anything else only moves their file counts
+                if not self.showing_search and any(event.kind == 'project' for event in events):
+                    self.update_file_tree()
+                else:
+                    self.refresh_project_rows(events)
+                return
+            
+            # Leave the project if it was deleted
+            if any(event.kind == 'project' and event.type == ChangeType.DELETED and event.id == self.current_project_id for event in events):
+                self.navigation_stack = []
+                self.go_back()
+                return
+            
+            structure_changed = False
+            for event in events:
+                if event.kind == 'project':
+                    continue
+                item_id = f"{event.kind}-{event.id}"
+                shown = self.tree.exists(item_id)
+                
+                #search results only follow the files already listed
+                in_view = event.parent_id == self.current_folder_id and not self.showing_search
+                
+                if event.type == ChangeType.DELETED or (event.type == ChangeType.MOVED and not in_view):
+                    if shown:
+                        if self.tree.focus() == item_id:
+                            self.deselect()
+                        self.tree.delete(item_id)
+                elif event.type in (ChangeType.CREATED, ChangeType.MOVED):
+                    if in_view and not shown:
+                        item = FolderInfo(event.id, event.name) if event.kind == 'folder' else FileInfo(event.id, event.name, None, event.description)
+                        self.tree.insert("", "end", iid=item_id, values=self.folder_item_row(item)[1])
+                elif shown and event.type == ChangeType.RENAMED:
+                    self.tree.set(item_id, "Name", event.name)
+                elif shown and event.type == ChangeType.SUMMARY_UPDATED:
+                    self.tree.set(item_id, "Description", event.description)
+                
+                structure_changed = structure_changed or event.type != ChangeType.RENAMED
+            
+            if structure_changed and not self.showing_search:
+                self.refresh_folder_counts()
+
+        def refresh_folder_counts(self):
+            #one query for the counts of every folder row shown
+            folder_ids = [int(item_id.split("-")[1]) for item_id in self.tree.get_children() if item_id.startswith("folder-")]
+            for folder_id, stats in self.fileManager.get_folders_stats(folder_ids).items():
+                self.tree.set(f"folder-{folder_id}", "Description", self.folder_item_row(FolderInfo(folder_id, ''), stats)[1][1])
+
+        def refresh_project_rows(self, events):
+            #re-read only the projects the events happened in, keeping the rows (and the selection) in place;
+            #a bulk import only touches a few folders per poll, so this stays cheap however many projects there are
+            folder_ids = set()
+            for event in events:
+                if event.kind == 'project':
+                    if event.type == ChangeType.DELETED:
+                        if self.tree.exists(f"project-{event.id}"):
+                            self.tree.delete(f"project-{event.id}")
+                    elif self.tree.exists(f"project-{event.id}"):
+                        #renamed: its root folder leads back to it
+                        try:
+                            folder_ids.add(self.fileManager.get_project_root(event.id).id)
+                        except ValueError:
+                            continue  # removed since
+                else:
+                    folder_ids.update(folder_id for folder_id in (event.parent_id, event.old_parent_id) if folder_id is not None)
+            
+            projects = {}
+            for folder_id in folder_ids:
+                try:
+                    project = self.fileManager.get_folder_project(folder_id)
+                except ValueError:
+                    continue  # removed since
+                projects[project.id] = project
+            
+            for project in projects.values():
+                item_id = f"project-{project.id}"
+                if not self.tree.exists(item_id):
+                    continue
+                stats = self.fileManager.get_project_stats(project.id)
+                self.tree.item(item_id, values=self.project_item_row(
+                    ProjectStats(project.id, project.name, project.description, project.status,
+                                 stats.total_files, stats.total_folders, stats.summarized_files, stats.pending_files))[1])
+
         def on_tree_item_double_click(self, event):
             selected_item = self.tree.focus()
             if not selected_item:
@@ -386,6 +498,34 @@ class projects_page_base(tk.Frame):
             except Exception as e:
                 print(f"Navigation failed: {e}")
                 
+        def search(self):
+            search_box_text = self.search_box.get().strip()
+            
+            #an empty search shows the current folder again
+            if (not search_box_text) or (search_box_text == self.PLACEHOLDER):
+                self.update_file_tree()
+                return
+            
+            #stop any page load that is still filling the tree
+            self.tree_generation += 1
+            self.showing_search = True
+            
+            if self.current_project_id is None:
+                #show the projects whose names match
+                self.tree.delete(*self.tree.get_children())
+                for page in self.fileManager.iter_projects_with_stats():
+                    for project in page:
+                        if search_box_text.lower() in project.name.lower():
+                            item_id, values = self.project_item_row(project)
+                            self.tree.insert("", "end", iid=item_id, values=values)
+                self.deselect()
+            else:
+                #show the best matching files in the whole project
+                self.tree.delete(*self.tree.get_children())
+                for file in self.fileManager.search_files(search_box_text, project_id=self.current_project_id):
+                    self.tree.insert("", "end", iid=f"file-{file.id}", values=(file.name, file.description, 'File'))
+                self.deselect()
+                
         def search_box_refresh(self):
             search_box_text = self.search_box.get().strip()
             
@@ -428,7 +568,12 @@ class projects_page_base(tk.Frame):
                 self.delete_button.config(state="normal")
                 self.delete_button.config(text="Delete File")
                 
-                self.file_description.config(text=self.fileManager.get_file(item_id).description, foreground="black")
+                description = self.fileManager.get_file(item_id).description
+                self.file_description.config(text=description, foreground="black")
+                
+                #the user is waiting on this summary, so it goes ahead of any bulk import
+                if not description:
+                    self.threaded_file_adder.prioritize_summary(item_id)
                 
                 self.rename_button.config(state="disabled")
                 self.rename_button.config(text="Rename")
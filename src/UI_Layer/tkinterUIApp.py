@@ -15,6 +15,7 @@ except Exception as e:
 
 from Backend.API_Key_Container.AccountDB import APIKeyManager
 from Backend.FileDatabase.database import fileDatabase
+from Backend.FileDatabase.tombstoneCollector import TombstoneCollector
 from UI_Layer.projectsPage import projects_page_base
 from UI_Layer.settingsPage import settings_page_base
 from UI_Layer.accountsPage import accounts_page_base
@@ -24,6 +25,9 @@ class MainApp():
     def __init__(self, screenName: str = 'Tropez'):
         self.APIKeyStore = APIKeyManager(db_url="sqlite:///api_keys.db")
         self.fileStore = fileDatabase(db_url="sqlite:///file_database.db")
+        #deletes only leave tombstones; this purges them in the background
+        self.fileCollector = TombstoneCollector(self.fileStore)
+        self.fileCollector.start()
         
         self.root = tk.Tk()
         self.style = ttk.Style(self.root)